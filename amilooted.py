@@ -31,109 +31,174 @@
 # 444), but only two for the Elementium Pocket Anvil (becaue Heroic caps at 441,
 # and it drops at an unupgradeable 441 on Mythic).
 
-import subprocess
+import argparse
 import os
 import sys
 import time
 import datetime
 import json
 import re
+import threading
 import traceback
-from models.player import Player, ItemCandidate
+from contextlib import closing
+from itertools import chain, islice
+from concurrent.futures import wait, FIRST_COMPLETED
+from models.player import Player, BestInSlot, ItemCandidate, SlotIndex, NO_CANDIDATE
+from models.item_key import ItemKey, item_key
+from models.report import ReportResult
+from models.run_state import RunState
+from utils.matrix_engine import UpgradeMatrix, numpy_available
+from utils.output_sinks import (OUTPUTS, OutputTable, FileSink, CsvSink, ParquetSink, SheetsSink, write_tables,
+                                 parquet_available)
 from collections import defaultdict
 from utils.constants import *
 from utils.item_utils import *
-from utils.player_utils import players, add_player, rolekey
+from utils.player_utils import players, add_player, sort_players, reset_players
 from utils.io_utils import *
+from utils.http_utils import (http_get, iter_lines, set_pool_size, host_concurrency, before_deadline, set_deadline,
+                              current_deadline, with_deadline, DeadlineExceeded, DEFAULT_WORKERS)
+from utils.thread_utils import DaemonThreadPool
+from utils.cache_utils import report_cache, get_raidbots_report_hash, DEFAULT_CACHE_MB, load_run_state, save_run_state
+from utils.store_utils import metadata_store, report_store
+from utils.trace_utils import tracer
+from utils.json_stream import read_json_path
 import xml.etree.ElementTree as ET
-try:
-    import requests
-except:
-    print("Requests library not installed!  Installing...")
-    subprocess.call([sys.executable, "-m", "pip", "install", "requests"])
-    print("Requests should be installed; this should only happen once.")
-    import requests
-
-#Dictionary of all the item names (key) being simmed in anyone's droptimizers and their item slots (value).
+
+#Reports are fetched and parsed on several threads at once, and print()
+#writes the text and the newline separately, so two threads' lines can run
+#together.  Anything printed off the main thread goes through here.
+_printLock = threading.Lock()
+def log(message):
+    with _printLock:
+        sys.stdout.write(message + "\n")
+
+#Dictionary of all the items (ItemKey) being simmed in anyone's droptimizers and their item slots (value).
 items = {}
-def add_to_items(itemname, itemSlot: str):
-    if itemname in items:
+def add_to_items(item, itemSlot: str):
+    if item in items:
             return
-    items[itemname] = itemSlot.lower()
+    items[item] = itemSlot.lower()
     
     
 
-#Dictionary of all the item names (key) being simmed in anyone's droptimizers and their source (value).
+#Dictionary of all the items (ItemKey) being simmed in anyone's droptimizers and their source (value).
 itemSources = {}
 
-def find_item_source(inputString):
-    for substring, mapped in sourcesLookup.items():
-        if substring in inputString:
-            return mapped
-   
-
-def add_to_item_sources(itemname, itemSource):
+def add_to_item_sources(item, itemSource):
     # For tier items, we want to store multiple sources
-    if tiercheck(itemname) or "Tier " in itemname:
-        if itemname not in itemSources:
-            itemSources[itemname] = set()
-        itemSources[itemname].add(itemSource)
+    if item.item_id in TIER_ITEM_IDS or tiercheck(item.name):
+        if item not in itemSources:
+            itemSources[item] = set()
+        itemSources[item].add(itemSource)
     else:
         # For non-tier items, keep the existing behavior
-        if itemname in itemSources:
+        if item in itemSources:
             return
-        itemSources[itemname] = itemSource
+        itemSources[item] = itemSource
     
-def add_to_item_bosses(itemName, bossName):
-    # For tier items, we want to store multiple bosses
-    if tiercheck(itemName) or "Tier " in itemName:
-        if itemName not in itemBosses:
-            itemBosses[itemName] = set()
-        itemBosses[itemName].add(bossName)
-    else:
-        # For non-tier items, keep the existing behavior
-        if itemName in itemBosses:
+def iter_raidbots_artifact(url, artifact):
+    #Yield a report artifact's bytes as they arrive.  Finished reports never
+    #change, so they come from the local cache when we have them; otherwise
+    #they're streamed from raidbots and copied into the cache on the way past.
+    #Error pages are passed through but never cached.
+    report_hash = get_raidbots_report_hash(url)
+    with tracer.span(artifact, "fetch", url=url) as span:
+        cached = report_cache.iter_chunks(report_hash, artifact)
+        if cached is not None:
+            tracer.count("Report cache hits")
+            span.args["source"] = "cache"
+            span.args["bytes"] = 0
+            for chunk in cached:
+                span.args["bytes"] += len(chunk)
+                yield chunk
             return
-        itemBosses[itemName] = bossName
-
-def find_item_boss(inputString):
-    for boss in bossesList:
-        if boss in inputString:
-            return boss  # Return the substring that is found
-    print("Boss drop for item not found, inputString:" + inputString)
-
-
-def resolve_qe_item_boss(inputString: str):
-    # 1. Remove the last 3 digits from input_string, if present
-    #    Regex finds 3 digits (\d{3}) at the very end of the string ($)
-    truncated_input = re.sub(r'\d{3}$', '', inputString).rstrip()
-    
-    # 2. Iterate over itemBosses' keys, removing last 3 digits from each key
-    for key, value in itemBosses.items():
-        truncated_key = re.sub(r'\d{3}$', '', key).rstrip()
-
-        # 3. Compare the truncated forms
-        if truncated_key == truncated_input:
-            return value
-
-    # 4. If no match was found
-    return "Unkown Boss"
-
-
-def add_to_item_bosses(itemName, bossName):
-    if itemName in itemBosses:
+        tracer.count("Report cache misses")
+        span.args["source"] = "raidbots"
+        span.args["bytes"] = 0
+        with http_get(url + artifact, stream=True) as resp:
+            span.args["status"] = resp.status_code
+            body = before_deadline(resp.iter_content(chunk_size=65536), url + artifact)
+            if not resp.ok or report_hash is None:
+                for chunk in body:
+                    span.args["bytes"] += len(chunk)
+                    yield chunk
+                return
+            writer = report_cache.writer(report_hash, artifact)
+            try:
+                for chunk in body:
+                    span.args["bytes"] += len(chunk)
+                    writer.write(chunk)
+                    yield chunk
+            except GeneratorExit:
+                #The parser stops reading input.txt at "# Simulation Options".
+                #Pull in the (short) rest anyway so the cache holds the whole
+                #file.
+                try:
+                    for chunk in body:
+                        span.args["bytes"] += len(chunk)
+                        writer.write(chunk)
+                except BaseException:
+                    writer.discard()
+                    raise
+                writer.commit()
+                raise
+            except BaseException:
+                writer.discard()
+                raise
+            writer.commit()
+
+def with_neighbours(lines):
+    #Yield (previous, line, next) for every line but the last, so a parser can
+    #look one line either way while only three lines are ever held.
+    prevline = None
+    lines = iter(lines)
+    line = next(lines, None)
+    if line is None:
         return
-    itemBosses[itemName] = bossName
-
-def grabraidbots(url):
+    for nextline in lines:
+        yield prevline, line, nextline
+        prevline, line = line, nextline
+
+def armory_spec(url, armoryline):
+    #Get spec from data.json.  We could do this in all cases, but I've chosen
+    #to only do it when necessary because data.json is quite large and I'd
+    #prefer to avoid downloading the whole thing.  So stream it and stop as
+    #soon as the first player's specialization goes past, and remember the
+    #answer so the same report never needs data.json again.
+    #armoryline looks like: armory=us,thrall,Foxfrost
+    region, realm, charname = armoryline.split("=", 1)[-1].split(",")[-3:]
+    report_hash = get_raidbots_report_hash(url)
+    if report_hash is not None and not report_cache.refresh:
+        spec = metadata_store.get_spec(region, realm, charname, report_hash)
+        if spec is not None:
+            tracer.count("Spec cache hits")
+            return spec
+    tracer.count("Spec cache misses")
+    with http_get(url + "data.json", stream=True) as resp:
+        resp.raise_for_status()
+        specialization = read_json_path(before_deadline(resp.iter_content(chunk_size=16384), url + "data.json"),
+                                        ("sim", "players", 0, "specialization"))
+    spec = specialization.split()[0]
+    if report_hash is not None:
+        metadata_store.put_spec(region, realm, charname, report_hash, spec)
+    return spec
+
+def grabraidbots(url, result: ReportResult):
     #Add a trailing / if we didn't already have one
     if not url[-1] == "/":
         url = url + "/"
-    inputurl = url + "input.txt"
-    outputurl = url + "data.csv"
     
-    inputdata = requests.get(inputurl).text.split("\n")
-    outputdata = requests.get(outputurl).text.split("\n")
+    #Both files are parsed as they stream in; neither is ever held whole.
+    with closing(iter_raidbots_artifact(url, "input.txt")) as chunks:
+        gearnames = parse_raidbots_input(url, iter_lines(chunks), result)
+    with closing(iter_raidbots_artifact(url, "data.csv")) as chunks:
+        parse_raidbots_output(iter_lines(chunks), gearnames, result)
+
+def parse_raidbots_input(url, inputlines, result: ReportResult):
+    #Reads the character and the simmed items out of input.txt's lines and
+    #returns the profileset name -> ItemKey mapping data.csv needs.
+    inputlines = iter(inputlines)
+    firstlines = list(islice(inputlines, 2))
     
     #If input came from the simc addon:
     #   Line 2 of inputdata looks like:
@@ -144,24 +209,21 @@ def grabraidbots(url):
     #Either way, get the character name from line 2.
     #But we can only get the specialization from input.txt if the simc addon
     #was used; if armory data was used, we have to dig into data.json.
-    if len(inputdata) < 2:
-        raise ValueError(f"input.txt is missing expected lines: {inputdata}")
+    if len(firstlines) < 2:
+        raise ValueError(f"input.txt is missing expected lines: {firstlines}")
     
     charname = ""
     spec = ""
-    if inputdata[1][0] == "#":
-        charname = inputdata[1].split()[1]
-        spec = inputdata[1].split()[3]
+    if firstlines[1][0] == "#":
+        charname = firstlines[1].split()[1]
+        spec = firstlines[1].split()[3]
     else:
-        charname = inputdata[1].split(",")[-1]
-        #Get spec from data.json.  We could do this in all cases,
-        #but I've chosen to only do it when necessary because data.json
-        #is quite large and I'd prefer to avoid downloading the whole thing.
-        jsondata = json.loads(requests.get(url+"data.json").text)
-        spec = jsondata["sim"]["players"][0]["specialization"].split()[0]
+        charname = firstlines[1].split(",")[-1]
+        spec = armory_spec(url, firstlines[1])
     
 
-    pindex = add_player(charname, spec)
+    result.charname = charname
+    result.spec = spec
     
     #Extract the names of the items simmed, as well as their profileset names
     #Item name example: Harlan's Loaded Dice 441
@@ -169,16 +231,19 @@ def grabraidbots(url):
     #Note that items will often have multiple profilesets associated with them.
     #Especially rings and trinkets, which get simmed multiple times in different
     #slots.
-    #However, profileset names will uniquely identify an item.
+    #However, profileset names will uniquely identify an item.  The item ID
+    #in them (155881 above) and the item level at the end of the item name
+    #make the item's ItemKey.
     #
     #The relevant information in the input file is between the "# Actors" line
     #and the "# Simulation Options" line.  So scan for those lines and use them
     #to bound where we look.
     relevant = False
     itemname = ""
+    item = item_key(None, itemname)
     gearnames = {}
-    for i in range(len(inputdata)- 1):
-        line = inputdata[i]
+    pattern = re.compile(r'\+=([A-Za-z_]+)(?:[12])?=,')
+    for prevline, line, nextline in with_neighbours(chain(firstlines, inputlines)):
         if line == "# Actors":
             relevant = True
             continue
@@ -195,9 +260,8 @@ def grabraidbots(url):
             continue
         if line[0] == "#":
             itemname = line.split(" - ")[0][1:].strip()
-            pattern = r'\+=([A-Za-z_]+)(?:[12])?=,'
 
-            match = re.search(pattern, inputdata[i+1])
+            match = pattern.search(nextline)
             if match:
                 itemslot = match.group(1)
             else:
@@ -205,79 +269,155 @@ def grabraidbots(url):
                 # Example line we're looking for:
                 # 'profileset."1273/2607/raid-normal/212388/597/3368/main_hand//"+=main_hand=,id=212388,enchant_id=3368,bonus_id=4822/4786/1498/10273'
                 itemslot = "weapon/off-hand/shield"
-                print("No match found in line:", inputdata[i+1])
+                log("No match found in line: " + nextline)
             #Ugly: if itemname is a tier piece, don't add it to the list of
             #items just yet.  Instead, we'll be changing itemname on the next
             #pass through this loop before we add it; we need the additional
             #context of the next line to figure out how to do this properly 
             #without hardcoding a lot of names.
             if not tiercheck(itemname):
-                add_to_items(itemname, itemslot)
-                add_to_item_sources(itemname, find_item_source(inputdata[i+1]))
-                add_to_item_bosses(itemname, find_item_boss(inputdata[i]))
+                item = item_key(profileset_item_id(nextline), itemname)
+                result.add_entry(item, itemslot,
+                                 find_item_source(nextline),
+                                 find_item_boss(line, nextline))
             continue
         
         key = line.split("\"")[1]
         if tiercheck(itemname):
-            itemname = tierfilter(itemname, key)
-            add_to_items(itemname, itemslot)
-            add_to_item_sources(itemname, find_item_source(key))
-            add_to_item_bosses(itemname, find_item_boss(inputdata[i-1]))
-        gearnames.update({line.split("\"")[1].removesuffix("swap_mh"):itemname})
+            item = tier_item_key(itemname, key)
+            itemname = item.name
+            result.add_entry(item, itemslot,
+                             find_item_source(key),
+                             find_item_boss(prevline, key))
+        gearnames.update({key.removesuffix("swap_mh"):item})
     
     #XXX: TODO: Sanity-check the input.  Make sure people are simming on
     #Patchwerk instead of HecticAddCleave or DungeonSlice.
-    
-    
+    return gearnames
+
+def parse_raidbots_output(outputlines, gearnames, result: ReportResult):
     #Now to start extracting the relevant information from the output.
     #Line 2 of data.csv has baseline DPS in its second column.
     #Further lines have profileset names in first column, new DPS in second.
-    baselinedps = float(outputdata[1].split(",")[1])
-    for line in outputdata[2:]:
+    #Rows are folded into the report's per-item best as they go by.
+    outputlines = iter(outputlines)
+    next(outputlines, None)
+    baselinedps = float(next(outputlines, "").split(",")[1])
+    for line in outputlines:
         if line == "":
             continue
         last_slash_index = line.rfind('/')
-        key = line[:last_slash_index] + "/" if last_slash_index != -1 else line
+        key = line[:last_slash_index + 1] if last_slash_index != -1 else line
         key = key.replace('"', '')
         item = gearnames[key]
         
-        if can_be_float(line.split(",")[1]):
-            newdps = float(line.split(",")[1])
+        fields = line.split(",")
+        if can_be_float(fields[1]):
+            newdps = float(fields[1])
         else:
-            newdps = float(line.split(",")[2])
+            newdps = float(fields[2])
         
         percentupgrade = round(int(10000 * (newdps - baselinedps)/baselinedps) * 0.01, 3)
-        if item in players[pindex].sims:
-            #This means we already added the item to the player's sims at some
-            #point, probably because this is a ring or trinket and we simmed it
-            #in the first slot before and this is the second slot.  Check to see
-            #if this is better; only update if it is.
-            if percentupgrade > players[pindex].sims[item]:
-                players[pindex].sims.update({item:percentupgrade})
-        else:
-            players[pindex].sims.update({item:percentupgrade})
+        result.add_sim(item, percentupgrade)
 
 
-def wowhead_item_name(item_id, ilvl):
+def wowhead_item_info(item_id):
+    #(name, slot) for item_id, or None if wowhead couldn't tell us.  These run
+    #a batch at a time, so one bad item mustn't take the others down with
+    #it; only running out of time stops the batch.
     url = f"https://www.wowhead.com/item={item_id}?xml"
-    resp = requests.get(url)
-    if not resp.ok:
+    try:
+        resp = http_get(url)
+        if not resp.ok:
+            return None
+
+        # Parse XML
+        root = ET.fromstring(resp.text)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        log(f"Could not look up item {item_id} on wowhead: {type(e).__name__}: {e}")
         return None
-
-    # Parse XML
-    root = ET.fromstring(resp.text)
     # The <wowhead> root usually contains <item> child
     item_elem = root.find("item")
     if item_elem is not None:
         # <name> sub-element typically holds the item name
         name_elem = item_elem.find("name")
         if name_elem is not None:
-            itemName = name_elem.text + " " + ilvl
             slot_elem = item_elem.find("inventorySlot")
-            add_to_items(itemName, standardize_qe_item_slot(slot_elem.text))
-            return itemName
+            return name_elem.text, slot_elem.text if slot_elem is not None else None
     return None
 
+def resolve_wowhead_items(item_ids):
+    #Look up names and slots for a batch of item IDs.  Anything we've seen on
+    #a previous run comes from the local store; only the misses go to wowhead,
+    #as many at once as wowhead's host limit allows, and whatever they return
+    #is saved for next time.
+    item_ids = list(dict.fromkeys(item_ids))
+    known = metadata_store.get_items(item_ids)
+    missing = [item_id for item_id in item_ids if item_id not in known]
+    tracer.count("Wowhead item cache hits", len(known))
+    tracer.count("Wowhead item cache misses", len(missing))
+    if missing:
+        fetched = {}
+        workers = min(len(missing), host_concurrency("www.wowhead.com"))
+        with DaemonThreadPool(workers, "wowhead") as pool:
+            lookup = with_deadline(current_deadline(), wowhead_item_info)
+            for item_id, info in zip(missing, pool.map(lookup, missing)):
+                if info is not None:
+                    fetched[item_id] = info
+        metadata_store.put_items(fetched)
+        known.update(fetched)
+    return known
+
+def resolve_qe_reports(results):
+    #QE reports share most of their item IDs, so name them all in one go
+    #before turning their rows into entries and sims.
+    item_ids = [row[0] for result in results for row in result.qe_items]
+    if not item_ids:
+        return
+    try:
+        iteminfo = resolve_wowhead_items(item_ids)
+    except DeadlineExceeded:
+        #Without names none of these reports is any use.
+        for result in results:
+            if result.qe_items:
+                result.error = "Ran out of time looking up item names on wowhead"
+                result.timed_out = True
+        return
+    except Exception:
+        iteminfo = {}
+        log(traceback.format_exc().rstrip("\n"))
+    name_qe_items(results, iteminfo)
+
+def name_qe_items(results, iteminfo):
+    #Turn QE rows into entries and sims, given {item ID: (name, slot)}.  A
+    #report with items wowhead couldn't name, or gave a slot we don't keep BiS
+    #for (or none at all), is marked failed: it's still merged with the rest,
+    #less those items, but it isn't stored, so the next run fetches it and
+    #tries to name them again.
+    for result in results:
+        unnamed = []
+        for item_id, ilvl, itemSource, percentage in result.qe_items:
+            info = iteminfo.get(item_id)
+            if info is None:
+                log(f"Could not find item {item_id} on wowhead, skipping it in {result.url}")
+                unnamed.append(item_id)
+                continue
+            itemSlot = standardize_qe_item_slot(info[1] or "")
+            if itemSlot not in BestInSlot.SLOT_POSITIONS:
+                log(f"Wowhead gave item {item_id} no slot we know ({info[1]!r}), skipping it in {result.url}")
+                unnamed.append(item_id)
+                continue
+            item = item_key(item_id, info[0] + " " + ilvl)
+            #TODO: Add to itemBosses properly via a mapping for healer exclusive items
+            result.add_entry(item, itemSlot, itemSource)
+            result.add_sim(item, percentage)
+        result.qe_items = []
+        if unnamed and result.error is None:
+            result.error = (f"Could not name or slot {len(unnamed)} item(s) on wowhead: "
+                            + ", ".join(str(item_id) for item_id in dict.fromkeys(unnamed)))
+
 def get_qe_report_id(url: str) -> str:
     """
     Extracts the QE Live report ID from a URL like:
@@ -291,13 +431,14 @@ def get_qe_report_id(url: str) -> str:
     parts = url.split('/')
     return parts[-1]
 
-def parse_qe_report(report_id):
+def parse_qe_report(url, result: ReportResult):
+    report_id = get_qe_report_id(url)
     url = f"https://questionablyepic.com/api/getUpgradeReport.php?reportID={report_id}"
-    resp = requests.get(url)
-    
-    # First parse
-    data = resp.json()
+    resp = http_get(url)
+    parse_qe_data(resp.json(), result)
 
+def parse_qe_data(data, result: ReportResult):
+    result.resolve_bosses = True
     # data is apparently a string with encoded JSON
     if isinstance(data, str):
         # Do a second decode
@@ -313,7 +454,8 @@ def parse_qe_report(report_id):
     realm = data["realm"]                 # e.g. "Thrall"
     region = data["region"]               # e.g. "US"
     spec = data.get("spec", "")           # e.g. "Holy Paladin"
-    pindex = add_player(charname, spec)
+    result.charname = charname
+    result.spec = spec
     # The "results" list holds all item upgrades
     results = data["results"]             # array of dicts
 
@@ -326,10 +468,10 @@ def parse_qe_report(report_id):
     #   rawDiff         (raw difference, e.g. 4371)
     #   percDiff        (percentage difference, e.g. 0.273)
 
-    # Do something with that data. For example, let's build a structured list:
+    # Item names come from wowhead later, in resolve_qe_reports, once every
+    # QE report's item IDs are known.
     for entry in results:
         ilvl = entry["level"]
-        itemName = wowhead_item_name(entry["item"], str(ilvl))
         location = entry["dropLoc"]
         difficulty = entry.get("dropDifficulty")
         
@@ -339,134 +481,290 @@ def parse_qe_report(report_id):
             itemSource = qeSourcesLookup[itemSourceRaw]
         else:
             itemSource = "Uknown Item Source"
-        add_to_item_sources(itemName, itemSource)
-        
-        #TODO: Add to itemBosses properly via a mapping for healer exclusive items
-        if itemName not in itemBosses.keys():
-            add_to_item_bosses(itemName, resolve_qe_item_boss(itemName))
+            count_lookup_miss("Unknown item source", itemSourceRaw)
         
         percentage = entry["percDiff"]   # in decimal form (0.273 = 27.3%)
-        
-        if itemName in players[pindex].sims:
-            #This means we already added the item to the player's sims at some
-            #point, probably because this is a ring or trinket and we simmed it
-            #in the first slot before and this is the second slot.  Check to see
-            #if this is better; only update if it is.
-            if percentage > players[pindex].sims[itemName]:
-                players[pindex].sims[itemName] = (percentage)
-            #else: 
-                #do nothing
-        else:
-            players[pindex].sims[itemName] = (percentage)
-        
-        
+        result.qe_items.append((entry["item"], str(ilvl), itemSource, percentage))
+
 
-def graburl(url):
+def fetch_report(url):
+    #Fetch and parse one report without touching the global registries, so
+    #this can run on any worker thread.  Returns None for anything that isn't
+    #a report link.
+    if "raidbots.com" in url:
+        parser = grabraidbots
+    elif "questionablyepic.com" in url:
+        parser = parse_qe_report
+    else:
+        return None
+    log("Checking " + url)
+    result = ReportResult(url)
+    with tracer.span(parser.__name__, "parse", url=url) as span:
+        try:
+            parser(url, result)
+        except Exception as e:
+            #Keep whatever the parser got through before failing; a serial run
+            #would have merged that much too.
+            result.error = traceback.format_exc()
+            result.timed_out = isinstance(e, DeadlineExceeded)
+            span.args["error"] = type(e).__name__
+        span.args["entries"] = len(result.entries) + len(result.qe_items)
+    return result
+
+def report_key(url):
+    #Reports are never edited after they're made, so a report's hash (or QE
+    #report ID) identifies its contents.  None if url isn't a report link.
+    if "raidbots.com" in url:
+        return get_raidbots_report_hash(url)
+    if "questionablyepic.com" in url:
+        return "qe:" + get_qe_report_id(url)
+    return None
+
+#A report still going after it's taken longer than HEDGE_PERCENTILE of the
+#finished ones (and at least HEDGE_MIN_SECONDS) is fetched a second time on
+#the side, and whichever copy finishes first is used.  A stalled connection
+#or an unlucky queue on raidbots' side then costs one typical fetch instead
+#of a timeout.  Hedging waits until HEDGE_MIN_REPORTS reports have finished,
+#so there's something to compare against.
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_SECONDS = 2.0
+HEDGE_MIN_REPORTS = 4
+HEDGE_WORKERS = 2
+#How often fetch_reports looks for reports to hedge.
+HEDGE_CHECK_INTERVAL = 0.1
+
+def hedge_threshold(durations):
+    #Seconds a report may take before it's hedged, or None if too few have
+    #finished to say.
+    if len(durations) < HEDGE_MIN_REPORTS:
+        return None
+    durations = sorted(durations)
+    return max(HEDGE_MIN_SECONDS, durations[int(HEDGE_PERCENTILE * (len(durations) - 1))])
+
+def fetch_reports(urls, workers=DEFAULT_WORKERS, refresh=False):
+    #Fetch every report on a bounded pool.  QE reports get a pool of their
+    #own, so they're all fetched at once instead of queueing behind the
+    #droptimizers, and their wowhead lookups go out as soon as the last one
+    #is in, while droptimizers are still downloading.  Slow reports are
+    #hedged (see HEDGE_PERCENTILE).  Results come back in the same order as
+    #urls, with QE item names already filled in.  Reports parsed by an
+    #earlier run come straight out of report_store (unless refresh), and
+    #newly parsed ones go into it.
+    #If the deadline (set_deadline) goes first, reports that weren't done
+    #come back with timed_out set, and nothing waits for them.  Every fetch
+    #is held to the deadline as it was when fetch_reports was called, even
+    #once the caller has moved on and set another one, and none of them keep
+    #the process alive once it's done.
+    deadline = current_deadline()
+    keys = {url: report_key(url) for url in urls}
+    known = {} if refresh else report_store.get_reports(keys)
+    #When each report's first fetch started, and how long finished fetches
+    #took; reports reused from report_store don't count.
+    started = {}
+    durations = []
+    def fetch_or_reuse(index):
+        url = urls[index]
+        result = known.get(keys[url])
+        if result is not None:
+            log("Already parsed " + url)
+            tracer.count("Parsed reports reused")
+            return result
+        start = time.monotonic()
+        started.setdefault(index, start)
+        result = fetch_report(url)
+        durations.append(time.monotonic() - start)
+        return result
+    set_pool_size(workers)
+    qe = [i for i, url in enumerate(urls) if "questionablyepic.com" in url and keys[url] not in known]
+    pool = DaemonThreadPool(workers, "fetch")
+    qe_pool = DaemonThreadPool(min(len(qe), host_concurrency("questionablyepic.com")), "qe")
+    hedge_pool = DaemonThreadPool(HEDGE_WORKERS, "hedge")
+    qe_indices = set(qe)
+    #index -> the fetches racing for that report: the first one, and maybe a
+    #hedge.  Reports move to done as soon as one of them succeeds (or all of
+    #them have failed).
+    racing = {i: [(qe_pool if i in qe_indices else pool).submit(with_deadline(deadline, fetch_or_reuse), i)]
+              for i in range(len(urls))}
+    done = {}
+    naming = None
     try:
-        if "raidbots.com" in url:
-            print("Checking " + url)
-            grabraidbots(url)
-        if "questionablyepic.com" in url:
-            print("Checking " + url)
-            parse_qe_report(get_qe_report_id(url))
-            
-    except Exception as e:
+        while racing or naming is None or not naming.done():
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                break
+            pending = [future for futures in racing.values() for future in futures if not future.done()]
+            if naming is not None and not naming.done():
+                pending.append(naming)
+            wait(pending, timeout=HEDGE_CHECK_INTERVAL if left is None else min(HEDGE_CHECK_INTERVAL, left),
+                 return_when=FIRST_COMPLETED)
+            threshold = hedge_threshold(durations)
+            now = time.monotonic()
+            for i, futures in list(racing.items()):
+                finished = [future.result() for future in futures if future.done()]
+                succeeded = [result for result in finished if result is None or result.error is None]
+                if succeeded or len(finished) == len(futures):
+                    done[i] = (succeeded or finished)[0]
+                    del racing[i]
+                elif len(futures) == 1 and threshold is not None and i in started and now - started[i] > threshold:
+                    log("Fetching " + urls[i] + " again, it's taking a while")
+                    tracer.count("Hedged reports")
+                    futures.append(hedge_pool.submit(with_deadline(deadline, fetch_report), urls[i]))
+            if naming is None and qe_indices <= done.keys():
+                naming = qe_pool.submit(with_deadline(deadline, resolve_qe_reports), [done[i] for i in qe if done[i] is not None])
+    finally:
+        #Fetches still running give up at the deadline on their own; don't
+        #wait for them.
+        for executor in (pool, qe_pool, hedge_pool):
+            executor.shutdown(wait=False, cancel_futures=True)
+    if racing or naming is None or not naming.done():
+        log(f"Out of time with {len(racing)} report(s) still fetching; going ahead without them.")
+    for i in racing:
+        result = done[i] = ReportResult(urls[i])
+        result.error = "Not finished before the deadline"
+        result.timed_out = True
+    if naming is None or not naming.done():
+        for i in qe:
+            if done[i] is not None and done[i].qe_items:
+                done[i].error = "Ran out of time looking up item names on wowhead"
+                done[i].timed_out = True
+    else:
+        naming.result()
+    results = [done[i] for i in range(len(urls)) if done[i] is not None]
+    #Failed reports aren't stored, so they're fetched again next time.
+    report_store.put_reports({keys[result.url]: result for result in results
+                              if keys[result.url] is not None and keys[result.url] not in known
+                              and result.error is None and result.charname is not None})
+    return results
+
+def merge_report(result: ReportResult):
+    #Apply a parsed report to players/items/itemSources/itemBosses.  Reports
+    #must be merged in simlist order: the registries keep the first source and
+    #boss they see for an item, and QE bosses resolve against what's already
+    #there.  Reports the deadline cut short are left out entirely; they're
+    #listed at the end of the run.
+    if result.timed_out:
+        return
+    if result.charname is not None:
+        apply_report(result)
+    if result.error is not None:
         print("ERROR with URL:")
-        print(url)
-        print("An unexpected error occurred:", e)
-        traceback.print_exc()
-
-def calculate_delta(player: Player, itemName: str, incomingValue: float, slot: str, source: str):
+        print(result.url)
+        print("An unexpected error occurred:")
+        print(result.error.rstrip("\n"))
+
+def apply_report(result: ReportResult):
+    pindex = add_player(result.charname, result.spec)
+    for item, slot, source, boss in result.entries:
+        if slot is not None:
+            add_to_items(item, slot)
+        add_to_item_sources(item, source)
+        if result.resolve_bosses:
+            if item not in itemBosses.keys():
+                add_to_item_bosses(item, resolve_qe_item_boss(item))
+        else:
+            add_to_item_bosses(item, boss)
+    sims = players[pindex].sims
+    for item, value in result.sims.items():
+        if item in sims:
+            #This means we already added the item to the player's sims at some
+            #point, probably from another droptimizer for the same spec.
+            #Check to see if this is better; only update if it is.
+            if value > sims[item]:
+                sims[item] = value
+        else:
+            sims[item] = value
+
+def reset_run_state():
+    #Forget every report, player and result, so the same process can start
+    #over with another simlist.
+    items.clear()
+    itemSources.clear()
+    item_Choices.clear()
+    reset_item_registries()
+    reset_players()
+    tracer.reset()
+
+def print_failed_reports(failed):
+    #A report that couldn't be fetched or parsed leaves its player out of the
+    #sheets (or with only part of their sims), so say which ones at the end
+    #where it can't scroll past unnoticed.
+    unfinished = [result for result in failed if result.timed_out]
+    broken = [result for result in failed if not result.timed_out]
+    if unfinished:
+        print()
+        print(f"{len(unfinished)} report(s) didn't finish before the deadline; these players are left out:")
+        for result in unfinished:
+            print(f"  {result.charname or 'Unknown player'} - {result.url}")
+    if broken:
+        print()
+        print(f"{len(broken)} report(s) failed; these players are missing or incomplete:")
+        for result in broken:
+            reason = result.error.strip().splitlines()[-1]
+            print(f"  {result.charname or 'Unknown player'} - {result.url} - {reason}")
+
+def calculate_delta(player: Player, itemKey: ItemKey, incomingValue: float, slot: str, source: str):
     if source == NORMAL_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        bis_item = player.normal_bis.get_bis(slot)
-        bis_value = player.sims[bis_item]
+        bis_value = player.sims[player.normal_bis.get_bis(slot)]
         delta_value = incomingValue - bis_value
-        player.normal_delta_matrix[itemName] = delta_value
+        player.normal_delta_matrix[itemKey] = delta_value
     
     if source == HEROIC_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        bis_item = player.heroic_bis.get_bis(slot)
-        bis_value = player.sims[bis_item]
+        bis_value = player.sims[player.heroic_bis.get_bis(slot)]
         delta_value = incomingValue - bis_value
-        player.heroic_delta_matrix[itemName] = delta_value
+        player.heroic_delta_matrix[itemKey] = delta_value
         
     if source == MYTHIC_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        bis_item = player.mythic_bis.get_bis(slot)
-        bis_value = player.sims[bis_item]
+        bis_value = player.sims[player.mythic_bis.get_bis(slot)]
         delta_value = incomingValue - bis_value
-        player.mythic_delta_matrix[itemName] = delta_value
+        player.mythic_delta_matrix[itemKey] = delta_value
 
-def build_delta_matrices():
-    for player in players:
-        for item in player.sims:
-            val = player.sims[item]
+def build_delta_matrices(targets=None):
+    for player in (players if targets is None else targets):
+        for item, val in player.sims.items():
             slot = items[item]
             source = itemSources[item]
             calculate_delta(player, item, val, slot, source)
 
 
-def check_and_add_bis(player: Player, itemName: str, incomingValue: float, slot: str, source: str):
-    #If item is from normal or dungeon, then check and add bis
-    if source == NORMAL_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        if player.normal_bis.get_bis(slot) is None: 
-            player.normal_bis.set_bis(slot, itemName)
-        else:   
-            current_bis = player.normal_bis.get_bis(slot)
-            if player.sims[current_bis] < incomingValue:
-                player.normal_bis.set_bis(slot, itemName)
-
-    #If item is from normal or dungeon, then check and add bis
-    if source == HEROIC_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        if player.heroic_bis.get_bis(slot) is None: 
-            player.heroic_bis.set_bis(slot, itemName)
-        else:    
-            current_bis = player.heroic_bis.get_bis(slot)
-            if player.sims[current_bis] < incomingValue:
-                player.heroic_bis.set_bis(slot, itemName)
-    
-    #If item is from normal or dungeon, then check and add bis
-    if source == MYTHIC_RAID_SOURCE or source == DUNGEON_SOURCE or source == CRAFTED_SOURCE:
-        if player.mythic_bis.get_bis(slot) is None: 
-            player.mythic_bis.set_bis(slot, itemName)
-        else:    
-            current_bis = player.mythic_bis.get_bis(slot)
-            if player.sims[current_bis] < incomingValue:
-                player.mythic_bis.set_bis(slot, itemName)        
+def build_slot_indexes(targets=None):
+    #Index every player's sims by (slot, source) once, after ingestion.  The
+    #BiS, delta and choice stages all read their best items from it.
+    for player in (players if targets is None else targets):
+        index = SlotIndex()
+        for item, val in player.sims.items():
+            source = itemSources[item]
+            #Tier pieces with several sources never count towards BiS or
+            #next-best; leave them out.
+            if isinstance(source, set):
+                continue
+            index.add(items[item], source, item, val)
+        player.slot_index = index
 
 #Finds the next best item in this slot for this raid difficulty
-#This looping is starting to be expensive, there are probably smarter ways to achieve this
 def find_next_best(player: Player, item: str, source: str):
-    next_best = None
-    slot = items[item]
-    for key in player.sims:
-        thisSource = itemSources[key]
-        if thisSource != DUNGEON_SOURCE and thisSource != CRAFTED_SOURCE and thisSource != DELVES_SOURCE and thisSource != source:
-            continue
-        if items[key] != slot or key == item:
-            continue
-        if next_best is None:
-            next_best = player.sims[key]
-            continue
-        if player.sims[key] > next_best:
-            next_best = player.sims[key]
-    return next_best if next_best is not None else 0
+    best = player.slot_index.best(items[item], alwaysAvailableSources + (source,), exclude=item)
+    return best[0] if best is not None else 0
 
 
-def populate_bis_lists():
-    for player in players:
-        for key in player.sims:
-            val = player.sims[key]
-            slot = items[key]
-            source = itemSources[key] 
-            check_and_add_bis(player, key, val, slot, source)
+def populate_bis_lists(targets=None):
+    for player in (players if targets is None else targets):
+        bis_lists = ((NORMAL_RAID_SOURCE, player.normal_bis),
+                     (HEROIC_RAID_SOURCE, player.heroic_bis),
+                     (MYTHIC_RAID_SOURCE, player.mythic_bis))
+        for slot in player.slot_index.slots():
+            for difficulty, bis in bis_lists:
+                best = player.slot_index.best(slot, bisSources[difficulty])
+                if best is not None:
+                    bis.set_bis(slot, best[2])
 
 item_Choices: dict[str, ItemCandidate] = {}
 def add_if_bis(item: str, source: str, choices, reason: str):
     for player in players:
-            if item in player.sims and player.sims[item] > 0:
+            item_val = player.sims.get(item)
+            if item_val is not None and item_val > 0:
                 
                 if source == NORMAL_RAID_SOURCE:
                     if player.normal_delta_matrix[item] == 0:
-                        item_val = player.sims[item]
                         next_best = find_next_best(player, item, source)
                         next_best_delta = item_val - next_best
                         if item_val > next_best:
@@ -479,7 +777,6 @@ def add_if_bis(item: str, source: str, choices, reason: str):
                         
                 if source == HEROIC_RAID_SOURCE:
                     if player.heroic_delta_matrix[item] == 0:
-                        item_val = player.sims[item]
                         next_best = find_next_best(player, item, source)
                         next_best_delta = item_val - next_best
                         if item_val > next_best:
@@ -492,7 +789,6 @@ def add_if_bis(item: str, source: str, choices, reason: str):
                         
                 if source == MYTHIC_RAID_SOURCE:
                     if player.mythic_delta_matrix[item] == 0:
-                        item_val = player.sims[item]
                         next_best = find_next_best(player, item, source)
                         next_best_delta = item_val - next_best
                         if item_val > next_best:
@@ -505,9 +801,9 @@ def add_if_bis(item: str, source: str, choices, reason: str):
 
 def add_if_upgrade(item:str, source:str, choices, reason: str):
     for player in players:
-        if item in player.sims and player.sims[item] > 0:
+        item_val = player.sims.get(item)
+        if item_val is not None and item_val > 0:
             if source == NORMAL_RAID_SOURCE:
-                item_val = player.sims[item]
                 next_best = find_next_best(player, item, source)
                 next_best_delta = item_val - next_best
                 choices.append(ItemCandidate(
@@ -518,7 +814,6 @@ def add_if_upgrade(item:str, source:str, choices, reason: str):
                     reason))
                     
             if source == HEROIC_RAID_SOURCE:
-                item_val = player.sims[item]
                 next_best = find_next_best(player, item, source)
                 next_best_delta = item_val - next_best
                 choices.append(ItemCandidate(
@@ -529,7 +824,6 @@ def add_if_upgrade(item:str, source:str, choices, reason: str):
                     reason))
                     
             if source == MYTHIC_RAID_SOURCE:
-                item_val = player.sims[item]
                 next_best = find_next_best(player, item, source)
                 next_best_delta = item_val - next_best
                 choices.append(ItemCandidate(
@@ -551,9 +845,11 @@ def remove_second_occurrences(choices):
 
     return filtered_choices
 
-def create_choices():
-    no_choice_player = Player("No choice", None, None)
+def create_choices(only=None):
+    #only: if given, just (re)do the items in it.
     for item in sorted(items.keys()):
+        if only is not None and item not in only:
+            continue
         source = itemSources[item]
         if source == DUNGEON_SOURCE or source == CRAFTED_SOURCE or source == DELVES_SOURCE:
             continue
@@ -578,201 +874,183 @@ def create_choices():
         item_Choices[item] = choices
         
         while len(choices) < 5:
-            choices.append(ItemCandidate(
-                        no_choice_player,
-                        0,
-                        0,
-                        0,
-                        "No candidate"))
+            choices.append(NO_CANDIDATE)
 
 def nested_dict():
     return defaultdict(nested_dict)
 
-def does_source_boss_match_exist(source, boss):
+def as_collection(value):
+    #Sources and bosses are sets for tier pieces, plain values otherwise.
+    return value if isinstance(value, set) else (value,)
+
+def source_boss_index():
+    #item -> the (source, boss) pairs it counts towards on the EV sheet, for
+    #every item any report mentioned.
+    itemPairs = {}
     for item, item_source in itemSources.items():
-        # Handle both single sources and sets of sources
-        sources_to_check = [item_source] if not isinstance(item_source, set) else item_source
-        
-        if source in sources_to_check:
-            item_boss = itemBosses.get(item)
-            # Handle both single bosses and sets of bosses
-            bosses_to_check = [item_boss] if not isinstance(item_boss, set) else item_boss
-            
-            if boss in bosses_to_check:
-                return True
-    return False
+        itemPairs[item] = [(source, boss)
+                           for source in as_collection(item_source)
+                           for boss in as_collection(itemBosses.get(item))]
+    return itemPairs
+
+def ev_totals(player: Player, itemPairs):
+    playerTotals = {}
+    for item, value in player.sims.items():
+        for pair in itemPairs.get(item, ()):
+            total = playerTotals.setdefault(pair, [0, 0])
+            total[0] += 1
+            if value > 0:
+                total[1] += value
+    return playerTotals
+
+def create_ev_dictionary(evTotals=None):
+    #One pass over every player's sims totals up each (source, boss) pair;
+    #the sheet then lists the pairs that have any items, in sourcesLookup and
+    #bossesList order, with each player's average upgrade and their average.
+    #evTotals ((name, spec) -> totals) keeps players' totals between runs;
+    #players already in it aren't totalled again.
+    if evTotals is None:
+        evTotals = {}
+    itemPairs = source_boss_index()
+    knownPairs = {pair for pairs in itemPairs.values() for pair in pairs}
+    totals = []
+    for player in players:
+        key = (player.name, player.spec)
+        if key not in evTotals:
+            evTotals[key] = ev_totals(player, itemPairs)
+        totals.append(evTotals[key])
 
-def create_ev_dictionary():
     ev_dict = nested_dict()
-    
     for source in sourcesLookup.values():
         for boss in bossesList:
-            if does_source_boss_match_exist(source, boss):
-                for player in players:
-                    total_count = 0
-                    non_negative_sum = 0
-                    for item in player.sims.keys():
-                        item_source = itemSources.get(item)
-                        item_boss = itemBosses.get(item)
-                        
-                        # Check if this item matches the current source and boss
-                        source_match = source == item_source if not isinstance(item_source, set) else source in item_source
-                        boss_match = boss == item_boss if not isinstance(item_boss, set) else boss in item_boss
-                        
-                        if source_match and boss_match:
-                            total_count += 1
-                            if player.sims[item] > 0:
-                                non_negative_sum += player.sims[item]
-                    ev_dict[source][boss][player.name] = round(non_negative_sum / total_count if total_count > 0 else 0, 3)
-    return add_average_to_ev_dictionary(ev_dict)
-
-def add_average_to_ev_dictionary(ev_dict: defaultdict):
-    for source in ev_dict.keys():
-        for boss in ev_dict[source].keys():
-            total_count = 0
+            if (source, boss) not in knownPairs:
+                continue
+            for player, playerTotals in zip(players, totals):
+                total_count, non_negative_sum = playerTotals.get((source, boss), (0, 0))
+                ev_dict[source][boss][player.name] = round(non_negative_sum / total_count if total_count > 0 else 0, 3)
+            if not players:
+                continue
+            bossValues = ev_dict[source][boss]
             non_negative_sum = 0
-            for player_name, value in ev_dict[source][boss].items():
-                total_count += 1
+            for value in bossValues.values():
                 if value > 0:
                     non_negative_sum += value
-            if total_count > 0:
-                average_value = non_negative_sum / total_count if total_count > 0 else 0
-                ev_dict[source][boss]["Average"] = round(average_value, 3)
-            else: 
-                ev_dict[source][boss]["Average"] = 0
+            bossValues["Average"] = round(non_negative_sum / len(bossValues), 3)
     return ev_dict
 
-def main():
-    #Ugly hack for stupid operating systems:
-    #Calling this by double-click on Windows makes us live in a weird directory
-    #somewhere.  Extract the real directory from sys.argv[0] and navigate there.
-    if not sys.argv[0] == "amilooted.py":
-        os.chdir(sys.argv[0][:-13])
-    simfile = "simlist.txt"
-    
-    if len(sys.argv) > 1:
-        simfile = sys.argv[1]
-
-    use_local = True
-    try:
-        simlines = open(simfile,"r").readlines()
-    except:
-        print(simfile + " could not be read!")
-        print("Using Am I Muted's online spreadsheet instead.")
-        use_local = False
-
-
-    if use_local:
-        linenum = 0
-        for line in simlines:
-            linenum += 1
-            graburl(line.split()[-1])
-
+def compute_results(engine, evTotals=None):
+    #BiS, deltas and choices for every player and item.  Returns the EV
+    #dictionary.
+    if engine == "numpy":
+        with tracer.span("upgrade_matrix", "compute"):
+            matrix = UpgradeMatrix(players, items, itemSources)
+        with tracer.span("populate_bis_lists", "compute"):
+            matrix.populate_bis_lists()
+        with tracer.span("build_delta_matrices", "compute"):
+            matrix.build_delta_matrices()
+        with tracer.span("create_choices", "compute"):
+            matrix.create_choices(item_Choices)
     else:
-        spreadsheeturl = "https://docs.google.com/spreadsheets/d/1jeBFHraMVA-IiuP-nLD0IWIaQom2av7XgDPa7qt43Ls/gviz/tq?tqx=out:csv&sheet=Droptimizer"
-        try:
-            spreadsheetdata = requests.get(spreadsheeturl).text.split("\n")
-        except:
-            print("Could not access URL:")
-            print(spreadsheeturl)
-            print("Press Enter to close the program.")
-            sys.exit(1)
-        #Check all the cells in the spreadsheet.  If any of them are raidbots links, run grabraidbots on them.
-        for line in spreadsheetdata:
-            cells = line.split(",")
-            name = ""
-            for cell in cells:
-                if cell != "":
-                    name = cell
-            #All entries from this download have quotes surrounding them.
-            for cell in cells:
-                #Strip leading and trailing quotation marks, then tokenize (this
-                #might be necessary if there are notes next to some urls).
-                data = cell[1:-1].split()
-                for d in data:
-                    graburl(d)
-
-    populate_bis_lists()
-    build_delta_matrices()
-    create_choices()
-    ev_dictionary = create_ev_dictionary()
-    
-    #Sort players alphabetically, and by role.  Tanks first, then DPS, then
-    #healers.
-    #Sort alphabetically first so that the role sorting actually works.
-    players.sort(key=lambda p: p.name)
-    players.sort(key=rolekey)
-            
-    outfilename = "droptimizers-" + \
-                  datetime.datetime.fromtimestamp( \
-                  time.time()).strftime("%d-%m-%Y") + ".csv"
-
-    output = open(outfilename,"w")
-    
-    mythicRaidFilename = "mythic-raid-choices-" + \
-                  datetime.datetime.fromtimestamp( \
-                  time.time()).strftime("%d-%m-%Y") + ".csv"
-                  
-    mythicRaidOutput = open(mythicRaidFilename,"w")
-    
-    heroicRaidFilename = "heroic-raid-choices-" + \
-                  datetime.datetime.fromtimestamp( \
-                  time.time()).strftime("%d-%m-%Y") + ".csv"
-                  
-    heroicRaidOutput = open(heroicRaidFilename,"w")
-    
-    normalRaidFilename = "normal-raid-choices-" + \
-                  datetime.datetime.fromtimestamp( \
-                  time.time()).strftime("%d-%m-%Y") + ".csv"
-                  
-    normalRaidOutput = open(normalRaidFilename,"w")
-    
-    
-    evFileName = "ev_sheet-"+ \
-                  datetime.datetime.fromtimestamp( \
-                  time.time()).strftime("%d-%m-%Y") + ".csv"
-    
-    evOutput = open(evFileName,"w")
-    
-    #Print headers for item, slot, and sources columns
-    output.write("Item Name" + "," + "Slot" + "," + "Source" + "," + "Boss")
-    evOutput.write("Source" + "," + "Boss" + "," + "Player" + "," + "EV")
-    
-    choicesFileHeaders = [
-        "Boss", "Item Name",
-        "Choice 1", "Choice 1 Reason", "Choice 1 % Upgrade", "Next Best Alternative",
-        "Choice 2", "Choice 2 Reason", "Choice 2 % Upgrade", "Next Best Alternative",
-        "Choice 3", "Choice 3 Reason", "Choice 3 % Upgrade", "Next Best Alternative",
-        "Choice 4", "Choice 4 Reason", "Choice 4 % Upgrade", "Next Best Alternative",
-        "Choice 5", "Choice 5 Reason", "Choice 5 % Upgrade", "Next Best Alternative",
-    ]
-    mythicRaidOutput.write(",".join(choicesFileHeaders) + "\n")
-    heroicRaidOutput.write(",".join(choicesFileHeaders) + "\n")
-    normalRaidOutput.write(",".join(choicesFileHeaders) + "\n")
-
-    #Instead of opening files, collect rows:
-    output_rows = []
-    mythicRaid_rows = []
-    heroicRaid_rows = []
-    normalRaid_rows = []
-    ev_rows = []
-
-    #Prepare headers as before, but as lists:
-    output_rows.append(["Item Name", "Slot", "Source", "Boss"] + [p.name + (f" ({p.spec})" if p.multispec else "") for p in players])
-    choicesFileHeaders = [
-        "Boss", "Item Name",
-        "Choice 1", "Choice 1 Reason", "Choice 1 % Upgrade", "Next Best Alternative",
-        "Choice 2", "Choice 2 Reason", "Choice 2 % Upgrade", "Next Best Alternative",
-        "Choice 3", "Choice 3 Reason", "Choice 3 % Upgrade", "Next Best Alternative",
-        "Choice 4", "Choice 4 Reason", "Choice 4 % Upgrade", "Next Best Alternative",
-        "Choice 5", "Choice 5 Reason", "Choice 5 % Upgrade", "Next Best Alternative",
-    ]
-    mythicRaid_rows.append(choicesFileHeaders)
-    heroicRaid_rows.append(choicesFileHeaders)
-    normalRaid_rows.append(choicesFileHeaders)
-
-
-    # In the part where you build rows for output
+        with tracer.span("build_slot_indexes", "compute"):
+            build_slot_indexes()
+        with tracer.span("populate_bis_lists", "compute"):
+            populate_bis_lists()
+        with tracer.span("build_delta_matrices", "compute"):
+            build_delta_matrices()
+        with tracer.span("create_choices", "compute"):
+            create_choices()
+    with tracer.span("create_ev_dictionary", "compute"):
+        return create_ev_dictionary(evTotals)
+
+def sims_signature(player: Player):
+    #Order matters (ties go to the earlier item) and so does the type of the
+    #value, since values are written out as they are.
+    return [(item, type(value), value) for item, value in player.sims.items()]
+
+def recompute_results(state: RunState, engine, evTotals):
+    #Like compute_results(), but keep last run's results for every player
+    #whose sims and items haven't changed since state was saved, and every
+    #item none of the changed players has.  The output is the same as a full
+    #run's.
+    previous = {(p.name, p.spec): p for p in state.players}
+    current = [(p.name, p.spec) for p in players]
+    #Candidate ties go to the earlier player, so if the players that are
+    #still here are in a different order now any item's choices could
+    #change.  The numpy engine redoes everyone in one go anyway, and the
+    #dict engine does too after a numpy run, which left no slot indexes.
+    survivors = set(current)
+    if engine == "numpy" or state.engine != engine or \
+       [key for key in current if key in previous] != [key for key in previous if key in survivors]:
+        return compute_results(engine, evTotals)
+
+    registries = ((items, state.items), (itemSources, state.itemSources), (itemBosses, state.itemBosses))
+    changedItems = {item for now, before in registries for item in chain(now, before)
+                    if now.get(item) != before.get(item)}
+    touched = set(changedItems)
+    affected = []
+    for player, key in zip(players, current):
+        old = previous.get(key)
+        if old is None or sims_signature(old) != sims_signature(player) or not changedItems.isdisjoint(player.sims):
+            affected.append(player)
+            touched.update(player.sims)
+            if old is not None:
+                touched.update(old.sims)
+            continue
+        player.normal_bis = old.normal_bis
+        player.heroic_bis = old.heroic_bis
+        player.mythic_bis = old.mythic_bis
+        player.normal_delta_matrix = old.normal_delta_matrix
+        player.heroic_delta_matrix = old.heroic_delta_matrix
+        player.mythic_delta_matrix = old.mythic_delta_matrix
+        player.slot_index = old.slot_index
+        if key in state.ev_totals:
+            evTotals[key] = state.ev_totals[key]
+    for key, old in previous.items():
+        if key not in survivors:
+            touched.update(old.sims)
+
+    with tracer.span("build_slot_indexes", "compute", players=len(affected)):
+        build_slot_indexes(affected)
+    with tracer.span("populate_bis_lists", "compute", players=len(affected)):
+        populate_bis_lists(affected)
+    with tracer.span("build_delta_matrices", "compute", players=len(affected)):
+        build_delta_matrices(affected)
+
+    #Last run's choices still hold for untouched items; point them at this
+    #run's Player objects.  Anyone else is the "No choice" padding.
+    byKey = dict(zip(current, players))
+    for item, choices in state.item_Choices.items():
+        if item in touched or item not in items:
+            continue
+        item_Choices[item] = [ItemCandidate(byKey[(c.player.name, c.player.spec)],
+                                            c.item_val, c.item_delta, c.next_best_val, c.candidate_reason)
+                              if previous.get((c.player.name, c.player.spec)) is c.player
+                              else NO_CANDIDATE
+                              for c in choices]
+    with tracer.span("create_choices", "compute", items=len(touched)):
+        create_choices(only=touched)
+    print(f"Recomputed {len(affected)} of {len(players)} players and "
+          f"{len(touched & items.keys())} of {len(items)} items.")
+    with tracer.span("create_ev_dictionary", "compute"):
+        return create_ev_dictionary(evTotals)
+
+def snapshot_run_state(evTotals, engine):
+    state = RunState()
+    state.engine = engine
+    state.items = dict(items)
+    state.itemSources = dict(itemSources)
+    state.itemBosses = dict(itemBosses)
+    state.players = list(players)
+    state.item_Choices = dict(item_Choices)
+    state.ev_totals = evTotals
+    return state
+
+def droptimizer_columns():
+    return ["Item Name", "Slot", "Source", "Boss"] + [p.name + (f" ({p.spec})" if p.multispec else "") for p in players]
+
+def droptimizer_rows():
+    #Every item with everyone's sim for it; tier pieces with several sources
+    #or bosses get a row per source/boss.
     for key in sorted(items.keys()):
         # Check if this is a tier item with multiple sources/bosses
         item_source = itemSources.get(key, "")
@@ -784,171 +1062,371 @@ def main():
             for source in item_source:
                 for boss in item_boss:
                     row = [
-                        key,
+                        key.name,
                         items[key],
                         source,
                         boss
                     ]
                     for p in players:
                         row.append(str(p.sims.get(key, "")))
-                    output_rows.append(row)
+                    yield row
         # If tier item with only multiple sources, create rows for each source
         elif isinstance(item_source, set):
             for source in item_source:
                 row = [
-                    key,
+                    key.name,
                     items[key],
                     source,
                     get_item_boss(key)
                 ]
                 for p in players:
                     row.append(str(p.sims.get(key, "")))
-                output_rows.append(row)
+                yield row
         # If tier item with only multiple bosses, create rows for each boss
         elif isinstance(item_boss, set):
             for boss in item_boss:
                 row = [
-                    key,
+                    key.name,
                     items[key],
                     get_item_source(key),
                     boss
                 ]
                 for p in players:
                     row.append(str(p.sims.get(key, "")))
-                output_rows.append(row)
+                yield row
         # Otherwise, just create a single row
         else:
             row = [
-                key,
+                key.name,
                 items[key],
                 get_item_source(key),
                 get_item_boss(key)
             ]
             for p in players:
                 row.append(str(p.sims.get(key, "")))
-            output_rows.append(row)
-
-
+            yield row
+
+choicesFileHeaders = [
+    "Boss", "Item Name",
+    "Choice 1", "Choice 1 Reason", "Choice 1 % Upgrade", "Next Best Alternative",
+    "Choice 2", "Choice 2 Reason", "Choice 2 % Upgrade", "Next Best Alternative",
+    "Choice 3", "Choice 3 Reason", "Choice 3 % Upgrade", "Next Best Alternative",
+    "Choice 4", "Choice 4 Reason", "Choice 4 % Upgrade", "Next Best Alternative",
+    "Choice 5", "Choice 5 Reason", "Choice 5 % Upgrade", "Next Best Alternative",
+]
+
+def choice_row(boss, item, choices):
+    row = [boss, item.name]
+    for c in choices:
+        row.extend([
+            getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
+            c.candidate_reason,
+            c.item_val,
+            c.next_best_val
+        ])
+    # Pad to 5 choices if needed
+    while len(row) < 22:
+        row.extend(["", "", "", ""])
+    return row
+
+def choice_rows(difficulty):
+    #The loot choices for every item that drops on this raid difficulty.
     for item in sorted(items.keys()):
         boss = itemBosses.get(item, "")
         item_source = itemSources.get(item, "")
         choices = item_Choices.get(item, [])
-        
-        # For items with multiple sources, we need to check each source
+
+        # Items with multiple sources (tier) get a row per boss if one of
+        # them is this difficulty
         if isinstance(item_source, set):
-            # For each source, create appropriate rows
-            if MYTHIC_RAID_SOURCE in item_source:
-                bosses = [boss] if not isinstance(boss, set) else boss
-                for b in bosses:
-                    row = [b, item]
-                    for c in choices:
-                        row.extend([
-                            getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                            c.candidate_reason,
-                            c.item_val,
-                            c.next_best_val
-                        ])
-                    # Pad to 5 choices if needed
-                    while len(row) < 22:
-                        row.extend(["", "", "", ""])
-                    mythicRaid_rows.append(row)
-                    
-            if HEROIC_RAID_SOURCE in item_source:
-                bosses = [boss] if not isinstance(boss, set) else boss
-                for b in bosses:
-                    row = [b, item]
-                    for c in choices:
-                        row.extend([
-                            getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                            c.candidate_reason,
-                            c.item_val,
-                            c.next_best_val
-                        ])
-                    while len(row) < 22:
-                        row.extend(["", "", "", ""])
-                    heroicRaid_rows.append(row)
-                    
-            if NORMAL_RAID_SOURCE in item_source:
+            if difficulty in item_source:
                 bosses = [boss] if not isinstance(boss, set) else boss
                 for b in bosses:
-                    row = [b, item]
-                    for c in choices:
-                        row.extend([
-                            getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                            c.candidate_reason,
-                            c.item_val,
-                            c.next_best_val
-                        ])
-                    while len(row) < 22:
-                        row.extend(["", "", "", ""])
-                    normalRaid_rows.append(row)
-        # For regular items with a single source
-        else:
-            # Build the row for each difficulty
-            if item_source == MYTHIC_RAID_SOURCE:
-                row = [boss, item]
-                for c in choices:
-                    row.extend([
-                        getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                        c.candidate_reason,
-                        c.item_val,
-                        c.next_best_val
-                    ])
-                # Pad to 5 choices if needed
-                while len(row) < 22:
-                    row.extend(["", "", "", ""])
-                mythicRaid_rows.append(row)
-            elif item_source == HEROIC_RAID_SOURCE:
-                row = [boss, item]
-                for c in choices:
-                    row.extend([
-                        getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                        c.candidate_reason,
-                        c.item_val,
-                        c.next_best_val
-                    ])
-                while len(row) < 22:
-                    row.extend(["", "", "", ""])
-                heroicRaid_rows.append(row)
-            elif item_source == NORMAL_RAID_SOURCE:
-                row = [boss, item]
-                for c in choices:
-                    row.extend([
-                        getattr(c.player, "name", "") + (f" ({c.player.spec})" if c.player.multispec else ""),
-                        c.candidate_reason,
-                        c.item_val,
-                        c.next_best_val
-                    ])
-                while len(row) < 22:
-                    row.extend(["", "", "", ""])
-                normalRaid_rows.append(row)
-
-    # EV Sheet
+                    yield choice_row(b, item, choices)
+        elif item_source == difficulty:
+            yield choice_row(boss, item, choices)
+
+def ev_rows(ev_dictionary):
     for source in ev_dictionary:
         for boss in ev_dictionary[source]:
             for player in ev_dictionary[source][boss]:
-                ev_rows.append([source, boss, player, ev_dictionary[source][boss][player]])
-
-    #Write to Google Sheets
-    service = get_sheets_service()
-    SPREADSHEET_ID = '1Or4KnQfl-lk-BsUG6URRDfkPKi5f8LgpDtvyxeumY6Y' # Old sheet id:'1h7UeLR_XygsUpc1-bFN9wCOFAa5-on43JSZ47XJhO4o'  # Replace with your Google Sheet ID
-
-    # Clear each sheet before writing
-    clear_sheet(service, SPREADSHEET_ID, 'amilooted.py')
-    clear_sheet(service, SPREADSHEET_ID, 'Mythic Raid Choices')
-    clear_sheet(service, SPREADSHEET_ID, 'Heroic Raid Choices')
-    clear_sheet(service, SPREADSHEET_ID, 'Normal Raid Choices')
-    clear_sheet(service, SPREADSHEET_ID, 'Expected Values')
-
-    write_to_sheet(service, SPREADSHEET_ID, 'amilooted.py', output_rows)
-    write_to_sheet(service, SPREADSHEET_ID, 'Mythic Raid Choices', mythicRaid_rows)
-    write_to_sheet(service, SPREADSHEET_ID, 'Heroic Raid Choices', heroicRaid_rows)
-    write_to_sheet(service, SPREADSHEET_ID, 'Normal Raid Choices', normalRaid_rows)
-    write_to_sheet(service, SPREADSHEET_ID, 'Expected Values', ev_rows)
-
-    print(f"Output written to Google Sheets workbook: {SPREADSHEET_ID}")
-    print("Press Enter to exit.")
-    input()
+                yield [source, boss, player, ev_dictionary[source][boss][player]]
+
+def output_tables(ev_dictionary):
+    return [
+        OutputTable('amilooted.py', "droptimizers", droptimizer_columns(), droptimizer_rows()),
+        OutputTable('Mythic Raid Choices', "mythic-raid-choices", choicesFileHeaders, choice_rows(MYTHIC_RAID_SOURCE)),
+        OutputTable('Heroic Raid Choices', "heroic-raid-choices", choicesFileHeaders, choice_rows(HEROIC_RAID_SOURCE)),
+        OutputTable('Normal Raid Choices', "normal-raid-choices", choicesFileHeaders, choice_rows(NORMAL_RAID_SOURCE)),
+        OutputTable('Expected Values', "ev_sheet", ["Source", "Boss", "Player", "EV"], ev_rows(ev_dictionary),
+                    columns_in_sheet=False),
+    ]
+
+SPREADSHEET_ID = '1Or4KnQfl-lk-BsUG6URRDfkPKi5f8LgpDtvyxeumY6Y' # Old sheet id:'1h7UeLR_XygsUpc1-bFN9wCOFAa5-on43JSZ47XJhO4o'  # Replace with your Google Sheet ID
+#Where the sim links come from when there's no simlist file.
+SIMLIST_SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/1jeBFHraMVA-IiuP-nLD0IWIaQom2av7XgDPa7qt43Ls/gviz/tq?tqx=out:csv&sheet=Droptimizer"
+
+def read_simfile(simfile):
+    #The URLs in simfile, the last thing on each line, or None if it can't
+    #be read.
+    try:
+        simlines = open(simfile,"r").readlines()
+    except:
+        return None
+    urls = []
+    for line in simlines:
+        urls.append(line.split()[-1])
+    return urls
+
+def read_spreadsheet():
+    #Every report link in the Droptimizer spreadsheet, or None if it can't be
+    #downloaded.
+    try:
+        spreadsheetdata = http_get(SIMLIST_SPREADSHEET_URL).text.split("\n")
+    except:
+        return None
+    urls = []
+    #Check all the cells in the spreadsheet.  If any of them are report links, fetch them below.
+    for line in spreadsheetdata:
+        cells = line.split(",")
+        #All entries from this download have quotes surrounding them.
+        for cell in cells:
+            #Strip leading and trailing quotation marks, then tokenize (this
+            #might be necessary if there are notes next to some urls).
+            data = cell[1:-1].split()
+            urls.extend(data)
+    return urls
+
+def merge_reports(results):
+    #Merge parsed reports in simlist order.  Returns the ones that failed.
+    with tracer.span("merge_reports", "compute", reports=len(results)):
+        for result in results:
+            merge_report(result)
+    failed = [result for result in results if result.error is not None]
+    tracer.count("Failed reports", len(failed))
+    return failed
+
+def compute_or_recompute(engine, state=None):
+    #Everything the sheets need from the merged reports: only what changed
+    #since state if there is one, everything otherwise.  Returns the EV
+    #dictionary and the EV totals behind it.
+    evTotals = {}
+    if state is not None:
+        ev_dictionary = recompute_results(state, engine, evTotals)
+    else:
+        ev_dictionary = compute_results(engine, evTotals)
+    return ev_dictionary, evTotals
+
+def publish(args, outputs, ev_dictionary, failed):
+    #Write the results everywhere outputs says, then report what happened.
+    datestamp = "-" + datetime.datetime.fromtimestamp(time.time()).strftime("%d-%m-%Y")
+    sinks = []
+    if "sheets" in outputs:
+        sheets = SheetsSink(SPREADSHEET_ID, only_changed=args.only_changed)
+        sinks.append(sheets)
+    if "csv" in outputs:
+        sinks.append(CsvSink(suffix=datestamp))
+    if "parquet" in outputs:
+        sinks.append(ParquetSink(suffix=datestamp))
+    with tracer.span("write_tables", "output", outputs=",".join(outputs)):
+        write_tables(output_tables(ev_dictionary), sinks)
+
+    print_lookup_misses()
+    print_failed_reports(failed)
+    for sink in sinks:
+        if isinstance(sink, FileSink):
+            for path in sink.written:
+                print(f"Output written to {path}")
+    if "sheets" in outputs:
+        if args.only_changed:
+            print("Updated tabs: " + (", ".join(sheets.written) if sheets.written else "none, nothing changed"))
+        print(f"Output written to Google Sheets workbook: {SPREADSHEET_ID}")
+    if args.trace:
+        print()
+        for line in tracer.summary():
+            print(line)
+        tracer.write_chrome_trace(args.trace)
+        print(f"Trace written to {args.trace}")
+
+#How often watch mode looks for changes.  The simlist file only needs a
+#stat; the spreadsheet has to be downloaded.
+WATCH_FILE_INTERVAL = 2
+WATCH_SHEET_INTERVAL = 30
+
+def watch(args, outputs):
+    #Keep running, and every time the simlist changes publish again, doing
+    #only the work the change needs.  Reports stay parsed in memory, so only
+    #new links are fetched; results are recomputed like --incremental does,
+    #for the players and items the change touches, from the last update's
+    #state in memory; and only tabs that changed are rewritten.  An update
+    #that fails is logged and tried again on the next check, from the last
+    #good update's state.  Runs until interrupted.
+    args.only_changed = True
+    use_local = os.path.exists(args.simfile)
+    interval = args.interval or (WATCH_FILE_INTERVAL if use_local else WATCH_SHEET_INTERVAL)
+    #url -> ReportResult for every report that parsed cleanly.
+    parsed = {}
+    state = load_run_state() if args.incremental and not args.refresh else None
+    #What the simlist says now, and what the last good update published.
+    urls = None
+    lastUrls = None
+    lastModified = None
+    print(f"Watching {args.simfile if use_local else 'the Droptimizer spreadsheet'} for changes; "
+          "press Ctrl+C to stop.")
+    try:
+        while True:
+            if use_local:
+                try:
+                    modified = os.stat(args.simfile).st_mtime_ns
+                except OSError:
+                    modified = None
+                if modified != lastModified:
+                    urls = read_simfile(args.simfile)
+                lastModified = modified
+            else:
+                urls = read_spreadsheet()
+            if urls is not None and urls != lastUrls:
+                try:
+                    state = watch_update(urls, parsed, state, args, outputs)
+                except Exception:
+                    log(traceback.format_exc().rstrip("\n"))
+                    print(f"Update failed; keeping the last results and trying again in {interval:g}s.")
+                else:
+                    lastUrls = urls
+                    #--refresh is for the first update; after that, everything
+                    #we have is from this process.
+                    args.refresh = report_cache.refresh = False
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+def watch_update(urls, parsed, state, args, outputs):
+    #One update for watch(): fetch the reports parsed doesn't have, merge
+    #everything again in simlist order, recompute and publish.  Returns the
+    #state the next update starts from.
+    start = time.monotonic()
+    print()
+    print(datetime.datetime.now().strftime("%H:%M:%S") + " The simlist changed, updating.")
+    reset_run_state()
+    for url in list(parsed):
+        if url not in urls:
+            del parsed[url]
+    new = [url for url in dict.fromkeys(urls) if url not in parsed]
+    set_deadline(args.deadline)
+    try:
+        with tracer.span("fetch_reports", "fetch", reports=len(new)):
+            fetched = {result.url: result for result in fetch_reports(new, args.workers, args.refresh)}
+    finally:
+        set_deadline(None)
+    parsed.update((url, result) for url, result in fetched.items() if result.error is None)
+    results = [parsed.get(url) or fetched.get(url) for url in urls]
+    failed = merge_reports([result for result in results if result is not None])
+
+    ev_dictionary, evTotals = compute_or_recompute(args.engine, state)
+    state = snapshot_run_state(evTotals, args.engine)
+    if args.incremental:
+        save_run_state(state)
+    sort_players()
+    publish(args, outputs, ev_dictionary, failed)
+    print(f"Updated in {time.monotonic() - start:.1f}s; watching for more changes.")
+    return state
+
+def main():
+    #Ugly hack for stupid operating systems:
+    #Calling this by double-click on Windows makes us live in a weird directory
+    #somewhere.  Extract the real directory from sys.argv[0] and navigate there.
+    if not sys.argv[0] == "amilooted.py":
+        os.chdir(sys.argv[0][:-13])
+    #"amilooted.py watch ..." takes the same options as a normal run.
+    argv = sys.argv[1:]
+    watching = argv[:1] == ["watch"]
+    if watching:
+        argv = argv[1:]
+    parser = argparse.ArgumentParser(description="Build loot council sheets from droptimizer sims.",
+                                     epilog="Run as 'amilooted.py watch [simfile] [options]' to keep running "
+                                            "and republish whenever the simlist (or, without one, the "
+                                            "Droptimizer spreadsheet) changes.")
+    parser.add_argument("simfile", nargs="?", default="simlist.txt",
+                        help="file of sim URLs, one per line (default: simlist.txt)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of reports to fetch at once (default: %(default)s)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached raidbots reports and download them again")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB,
+                        help="size limit of the local report cache in MB (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse the last --incremental run's results, and only "
+                             "recompute what the new or changed reports affect")
+    parser.add_argument("--only-changed", action="store_true",
+                        help="only rewrite spreadsheet tabs whose contents changed since the last publish")
+    parser.add_argument("--output", default="sheets,csv",
+                        help="where to write the results, comma-separated: " + ", ".join(OUTPUTS) +
+                             " (default: %(default)s)")
+    parser.add_argument("--engine", choices=["dict", "numpy"], default="dict",
+                        help="how to work out BiS, deltas and choices; numpy is faster on big "
+                             "rosters and needs numpy installed (default: %(default)s)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="time every fetch, parse and stage and write it to FILE in Chrome's "
+                             "trace-event format (open in chrome://tracing or ui.perfetto.dev)")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="stop waiting for reports SECONDS after starting and publish the players that "
+                             "are in, listing the reports that weren't (default: wait for all of them)")
+    parser.add_argument("--headless", action="store_true",
+                        help="don't wait for Enter before exiting, for cron jobs and CI")
+    parser.add_argument("--interval", type=float, metavar="SECONDS",
+                        help="watch mode: how often to look for changes (default: "
+                             f"{WATCH_FILE_INTERVAL}s for a simlist file, {WATCH_SHEET_INTERVAL}s for the spreadsheet)")
+    args = parser.parse_args(argv)
+    outputs = [output.strip() for output in args.output.split(",") if output.strip()]
+    for output in outputs:
+        if output not in OUTPUTS:
+            parser.error(f"unknown output {output!r}; choose from " + ", ".join(OUTPUTS))
+    if "parquet" in outputs and not parquet_available():
+        print("pyarrow is not installed; skipping Parquet output.")
+        outputs.remove("parquet")
+    if "sheets" in outputs and not sheets_available():
+        print("The Google API client libraries are not installed; skipping Google Sheets output.")
+        outputs.remove("sheets")
+    if args.engine == "numpy" and not numpy_available():
+        print("numpy is not installed; using the dict engine instead.")
+        args.engine = "dict"
+    report_cache.refresh = args.refresh
+    report_cache.max_bytes = args.cache_mb * 1024 * 1024
+    if watching:
+        watch(args, outputs)
+        return
+    set_deadline(args.deadline)
+
+    urls = read_simfile(args.simfile)
+    if urls is None:
+        print(args.simfile + " could not be read!")
+        print("Using Am I Muted's online spreadsheet instead.")
+        urls = read_spreadsheet()
+        if urls is None:
+            print("Could not access URL:")
+            print(SIMLIST_SPREADSHEET_URL)
+            sys.exit(1)
+
+    #--refresh means starting over, but the run still leaves its state behind.
+    state = load_run_state() if args.incremental and not args.refresh else None
+    with tracer.span("fetch_reports", "fetch", reports=len(urls)):
+        results = fetch_reports(urls, args.workers, args.refresh)
+    #The deadline is for the network; publishing goes ahead regardless.
+    set_deadline(None)
+    failed = merge_reports(results)
+    #Everything we need from the reports is in the players and registries now.
+    del results
+
+    ev_dictionary, evTotals = compute_or_recompute(args.engine, state)
+    if args.incremental:
+        save_run_state(snapshot_run_state(evTotals, args.engine))
+    
+    #Tanks first, then DPS, then healers, alphabetically within each.
+    sort_players()
+    publish(args, outputs, ev_dictionary, failed)
+    if not args.headless:
+        print("Press Enter to exit.")
+        input()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,206 @@
+#Times every stage of the pipeline on synthetic rosters, fully offline.
+#
+#Use: python benchmarks/bench_stages.py [--players 20,40,200] [--items 400]
+#         [--difficulties 3] [--repeat 3] [--engine dict|numpy|both]
+#         [--json results.json]
+#
+#Each stage is timed on its own (best of --repeat runs of the whole
+#pipeline), then the pipeline runs once more under tracemalloc for each
+#stage's peak memory: the most it allocated on top of what was already live
+#when it started, and what it left allocated.  --json writes everything in a
+#form that's easy to diff between runs.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amilooted
+from amilooted import (parse_raidbots_input, parse_raidbots_output, parse_qe_data, name_qe_items,
+                       merge_report, build_slot_indexes, populate_bis_lists, build_delta_matrices, create_choices,
+                       create_ev_dictionary, output_tables, reset_run_state)
+from models.report import ReportResult
+from utils.http_utils import iter_lines
+from utils.matrix_engine import UpgradeMatrix, numpy_available, load_numpy
+from utils.player_utils import players, sort_players
+from synthetic import make_roster
+
+CHUNK_BYTES = 65536
+
+def chunked(text):
+    #Hand the parsers bytes in chunks, like a download or the report cache.
+    data = text.encode("utf-8")
+    return [data[i:i + CHUNK_BYTES] for i in range(0, len(data), CHUNK_BYTES)]
+
+def prepare(roster):
+    #Everything the ingest stage reads, encoded up front so it isn't timed.
+    return [(report, chunked(report.input_txt), chunked(report.data_csv)) if report.qe_data is None
+            else (report, None, None) for report in roster.reports]
+
+def stage_ingest(ctx):
+    results = []
+    qe_results = []
+    for report, input_chunks, csv_chunks in ctx["prepared"]:
+        result = ReportResult(report.url)
+        if report.qe_data is not None:
+            parse_qe_data(report.qe_data, result)
+            qe_results.append(result)
+        else:
+            gearnames = parse_raidbots_input(report.url, iter_lines(input_chunks), result)
+            parse_raidbots_output(iter_lines(csv_chunks), gearnames, result)
+        results.append(result)
+    name_qe_items(qe_results, ctx["roster"].iteminfo)
+    ctx["results"] = results
+
+def stage_merge(ctx):
+    for result in ctx["results"]:
+        merge_report(result)
+
+def stage_ev(ctx):
+    ctx["ev"] = create_ev_dictionary()
+
+def stage_rows(ctx):
+    sort_players()
+    rows = 0
+    for table in output_tables(ctx["ev"]):
+        for row in table.rows:
+            rows += 1
+    ctx["rows"] = rows
+
+def stage_numpy_matrix(ctx):
+    ctx["matrix"] = UpgradeMatrix(players, amilooted.items, amilooted.itemSources)
+
+DICT_STAGES = [
+    ("ingest", stage_ingest),
+    ("merge", stage_merge),
+    ("slot_indexes", lambda ctx: build_slot_indexes()),
+    ("populate_bis_lists", lambda ctx: populate_bis_lists()),
+    ("build_delta_matrices", lambda ctx: build_delta_matrices()),
+    ("create_choices", lambda ctx: create_choices()),
+    ("create_ev_dictionary", stage_ev),
+    ("rows", stage_rows),
+]
+NUMPY_STAGES = [
+    ("ingest", stage_ingest),
+    ("merge", stage_merge),
+    ("numpy_matrix", stage_numpy_matrix),
+    ("populate_bis_lists", lambda ctx: ctx["matrix"].populate_bis_lists()),
+    ("build_delta_matrices", lambda ctx: ctx["matrix"].build_delta_matrices()),
+    ("create_choices", lambda ctx: ctx["matrix"].create_choices(amilooted.item_Choices)),
+    ("create_ev_dictionary", stage_ev),
+    ("rows", stage_rows),
+]
+
+def run_pipeline(stages, ctx, measure_memory=False):
+    #Returns {stage: seconds} or, with measure_memory, {stage: (peak, retained)}.
+    reset_run_state()
+    measured = {}
+    #The parsers and merge print the odd warning; keep them out of the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, stage in stages:
+            if measure_memory:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                stage(ctx)
+                current, peak = tracemalloc.get_traced_memory()
+                measured[name] = (peak - before, current - before)
+            else:
+                start = time.perf_counter()
+                stage(ctx)
+                measured[name] = time.perf_counter() - start
+    return measured
+
+def bench_roster(roster, engine, repeat):
+    stages = NUMPY_STAGES if engine == "numpy" else DICT_STAGES
+    ctx = {"roster": roster, "prepared": prepare(roster)}
+    best = {}
+    for _ in range(max(1, repeat)):
+        for name, seconds in run_pipeline(stages, ctx).items():
+            best[name] = min(seconds, best.get(name, seconds))
+    tracemalloc.start()
+    try:
+        memory = run_pipeline(stages, ctx, measure_memory=True)
+    finally:
+        tracemalloc.stop()
+    return {
+        "players": roster.players,
+        "difficulties": roster.difficulties,
+        "items": roster.items,
+        "reports": len(roster.reports),
+        "simmed_players": len(players),
+        "item_rows": len(amilooted.items),
+        "output_rows": ctx["rows"],
+        "engine": engine,
+        "stages": {name: {"seconds": round(best[name], 6),
+                          "peak_bytes": memory[name][0],
+                          "retained_bytes": memory[name][1]}
+                   for name, _ in stages},
+    }
+
+def print_table(runs, out, header=True):
+    if header:
+        out.write(f"{'roster':<22} {'engine':<6} {'stage':<22} {'seconds':>10} {'peak MB':>9} {'kept MB':>9}\n")
+    for run in runs:
+        roster = f"{run['players']}p x {run['difficulties']}d x {run['items']}i"
+        for name, stage in run["stages"].items():
+            out.write(f"{roster:<22} {run['engine']:<6} {name:<22} {stage['seconds']:>10.4f} "
+                      f"{stage['peak_bytes'] / 1048576:>9.2f} {stage['retained_bytes'] / 1048576:>9.2f}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic rosters.")
+    parser.add_argument("--players", default="20,40,200",
+                        help="comma-separated roster sizes (default: %(default)s)")
+    parser.add_argument("--difficulties", type=int, default=3, choices=[1, 2, 3],
+                        help="raid difficulties simmed per player (default: %(default)s)")
+    parser.add_argument("--items", type=int, default=400,
+                        help="items in each droptimizer (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timing runs per roster; the best is kept (default: %(default)s)")
+    parser.add_argument("--engine", choices=["dict", "numpy", "both"], default="dict",
+                        help="which BiS/delta/choices engine to time (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results as JSON to FILE ('-' for stdout, instead of the table)")
+    args = parser.parse_args(argv)
+
+    engines = ["dict", "numpy"] if args.engine == "both" else [args.engine]
+    if "numpy" in engines:
+        if not numpy_available():
+            parser.error("numpy is not installed")
+        #Imported up front so the first numpy_matrix timing doesn't include it.
+        load_numpy()
+
+    runs = []
+    for size in (int(n) for n in args.players.split(",") if n.strip()):
+        roster = make_roster(size, args.difficulties, args.items, seed=args.seed)
+        for engine in engines:
+            runs.append(bench_roster(roster, engine, args.repeat))
+            if args.json != "-":
+                print_table(runs[-1:], sys.stdout, header=len(runs) == 1)
+    reset_run_state()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": load_numpy().__version__ if numpy_available() else None,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "runs": runs,
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#Synthetic droptimizer fixtures for the benchmarks: Raidbots input.txt and
+#data.csv for every player and difficulty, plus QE upgrade reports for some
+#players, shaped like the real thing closely enough for the parsers.
+#Everything is generated in memory from a seed, so runs are repeatable and
+#never touch the network.
+import json
+import random
+from utils.constants import encounterBosses, tierKeywords
+
+SLOTS = ["head", "neck", "shoulder", "back", "chest", "wrist", "hands", "waist", "legs", "feet",
+         "finger", "trinket", "main_hand", "off_hand"]
+TIER_SLOTS = {"head": "Crown", "shoulder": "Shoulderpads", "chest": "Vest", "hands": "Grips", "legs": "Leggings"}
+DIFFICULTIES = [("raid-normal", 636, 3), ("raid-heroic", 649, 5), ("raid-mythic", 662, 7)]
+SPECS = ["Protection", "Frost", "Fire", "Holy", "Enhancement", "Restoration", "Balance", "Blood"]
+#QE's inventorySlot names for our slots.
+WOWHEAD_SLOTS = {"main_hand": "Two-Hand", "off_hand": "Held In Off-hand", "finger": "Finger", "trinket": "Trinket"}
+#Encounter ID -> instance ID, for the profileset names.
+INSTANCES = {2607: 1273, 2611: 1273, 2599: 1273, 2609: 1273, 2612: 1273, 2601: 1273, 2608: 1273, 2602: 1273,
+             2639: 1296, 2640: 1296, 2641: 1296, 2642: 1296, 2653: 1296, 2644: 1296, 2645: 1296, 2646: 1296,
+             2684: 1302, 2686: 1302, 2685: 1302, 2687: 1302, 2688: 1302, 2747: 1302, 2690: 1302, 2691: 1302}
+DUNGEON_ITEM_SHARE = 0.1
+
+class SyntheticItem:
+    def __init__(self, item_id, name, slot, encounter, boss, dungeon=False):
+        self.item_id = item_id
+        self.name = name
+        self.slot = slot
+        self.encounter = encounter
+        self.boss = boss
+        self.dungeon = dungeon
+
+class SyntheticReport:
+    def __init__(self, url, charname, spec):
+        self.url = url
+        self.charname = charname
+        self.spec = spec
+        #Raidbots reports have these two...
+        self.input_txt = None
+        self.data_csv = None
+        #...QE reports have this (the API's doubly encoded JSON, decoded once).
+        self.qe_data = None
+
+class SyntheticRoster:
+    def __init__(self, players, difficulties, items, reports, iteminfo):
+        self.players = players
+        self.difficulties = difficulties
+        self.items = items
+        self.reports = reports
+        #Item ID -> (name, wowhead slot), what wowhead would tell us about
+        #the items in QE reports.
+        self.iteminfo = iteminfo
+
+    def __repr__(self):
+        return f"{self.players} players x {self.difficulties} difficulties x {self.items} items"
+
+def make_items(nitems, rnd):
+    encounters = list(encounterBosses.items())
+    tiernames = [tier["match"] for tier in tierKeywords["tiernames"]]
+    items = []
+    for i in range(nitems):
+        slot = SLOTS[i % len(SLOTS)]
+        encounter, boss = encounters[i % len(encounters)]
+        if rnd.random() < DUNGEON_ITEM_SHARE:
+            items.append(SyntheticItem(300000 + i, f"Dungeon {slot.replace('_', ' ').title()} {i:04d}", slot,
+                                       1001, "Mythic+ Dungeons", dungeon=True))
+        elif slot in TIER_SLOTS and i % 7 == 0:
+            name = f"{tiernames[i % len(tiernames)]} {TIER_SLOTS[slot]}"
+            items.append(SyntheticItem(200000 + i, name, slot, encounter, boss))
+        else:
+            items.append(SyntheticItem(200000 + i, f"Synthetic {slot.replace('_', ' ').title()} {i:04d}", slot,
+                                       encounter, boss))
+    return items
+
+def raidbots_report(url, charname, spec, difficulty, ilvl, items, coverage, rnd):
+    report = SyntheticReport(url, charname, spec)
+    inp = ["# SimC Addon", f"# {charname} - {spec} - 2025-03-04 19:18 - US/Thrall", 'warrior="x"', "",
+           "# Actors", ""]
+    baseline = 100000.0 + rnd.randint(0, 50000)
+    csv = ["name,mean,min", f"{charname},{baseline},1"]
+    for item in items:
+        if rnd.random() > coverage:
+            continue
+        if item.dungeon:
+            instance, diff, lv = -1, "dungeon-mythic-weekly10", 639
+        else:
+            instance, diff, lv = INSTANCES[item.encounter], difficulty, ilvl
+        inp.append(f"# {item.name} {lv} - {item.boss} (Synthetic)")
+        slots = [item.slot + "1", item.slot + "2"] if item.slot in ("finger", "trinket") else [item.slot]
+        for slot in slots:
+            key = f"{instance}/{item.encounter}/{diff}/{item.item_id}/{lv}/0/{slot}/"
+            inp.append(f'profileset."{key}"+={slot}=,id={item.item_id},bonus_id=1')
+            csv.append(f'"{key}",{baseline + rnd.randint(-3000, 6000)},1')
+        inp.append("")
+    inp += ["# Simulation Options", "iterations=1", ""]
+    report.input_txt = "\n".join(inp)
+    report.data_csv = "\n".join(csv) + "\n"
+    return report
+
+def qe_report(url, charname, spec, items, coverage, rnd):
+    report = SyntheticReport(url, charname, spec)
+    results = []
+    for item in items:
+        if item.dungeon or rnd.random() > coverage:
+            continue
+        for _, ilvl, qediff in DIFFICULTIES:
+            results.append({"item": item.item_id, "dropLoc": "Raid", "dropDifficulty": qediff, "level": ilvl,
+                            "score": 0.1, "rawDiff": 1, "percDiff": round(rnd.uniform(-1, 3), 3)})
+    report.qe_data = json.dumps({"id": url.rsplit("/", 1)[-1], "dateCreated": "2025 - 03 - 04",
+                                 "playername": charname, "realm": "Thrall", "region": "US",
+                                 "spec": spec + " Paladin", "results": results})
+    return report
+
+def make_roster(players=20, difficulties=3, items=400, seed=1, coverage=0.85, qe_every=4):
+    """
+    Build a roster's worth of reports: one Raidbots droptimizer per player and
+    difficulty over the same items, and a QE report for every qe_every-th
+    player.
+    """
+    rnd = random.Random(seed)
+    itemlist = make_items(items, rnd)
+    reports = []
+    n = 0
+    for p in range(players):
+        charname, spec = f"Player{p:03d}", SPECS[p % len(SPECS)]
+        for difficulty, ilvl, _ in DIFFICULTIES[:difficulties]:
+            n += 1
+            reports.append(raidbots_report(f"https://www.raidbots.com/reports/synthetic{n:05d}/",
+                                           charname, spec, difficulty, ilvl, itemlist, coverage, rnd))
+        if qe_every and p % qe_every == qe_every - 1:
+            reports.append(qe_report(f"https://questionablyepic.com/live/upgradereport/synthetic{p:03d}",
+                                     charname + "qe", "Holy", itemlist, coverage, rnd))
+    iteminfo = {item.item_id: (item.name, WOWHEAD_SLOTS.get(item.slot, item.slot.title()))
+                for item in itemlist if not item.dungeon}
+    return SyntheticRoster(players, difficulties, items, reports, iteminfo)
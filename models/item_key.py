@@ -0,0 +1,59 @@
+import threading
+
+#What identifies an item across reports: its item ID and item level.
+#Raidbots profilesets and QE rows both carry the item ID, so the same item
+#from either matches with one dict lookup instead of hoping the names line
+#up.  The difficulty isn't part of it: the same item at the same item level
+#is one row however many difficulties drop it (tier pieces list all of
+#theirs), and the registries keep the source separately.
+#
+#name is what the sheets show, e.g. "Harlan's Loaded Dice 441".  Reports
+#are parsed on several threads at once, so if two of them spell the same item
+#differently the name that sorts first wins, whichever thread got there first.
+#Merged tier pieces ("Tier Helmet 441") get a made-up negative item ID per
+#piece; see tier_item_key().
+#
+#Keys are interned: there is one ItemKey per identity, so they compare and
+#hash by identity, and sort by name.
+class ItemKey:
+    __slots__ = ("item_id", "ilvl", "name")
+
+    def __init__(self, item_id, ilvl, name):
+        self.item_id = item_id
+        self.ilvl = ilvl
+        self.name = name
+
+    def __lt__(self, other):
+        return self.name < other.name
+
+    #Loaded keys are interned again, so they're the same objects as this
+    #run's.
+    def __reduce__(self):
+        return (item_key, (self.item_id, self.name))
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"ItemKey({self.item_id}, {self.ilvl}, {self.name!r})"
+
+
+_keys = {}
+_keysLock = threading.Lock()
+
+def name_ilvl(name):
+    #Item names end in their item level: "Harlan's Loaded Dice 441".
+    ilvl = name.rsplit(" ", 1)[-1]
+    return int(ilvl) if ilvl.isdigit() else None
+
+def item_key(item_id, name):
+    """The ItemKey for item_id at the item level name ends in.  Without an item ID, name is all there is."""
+    ilvl = name_ilvl(name)
+    identity = (item_id, ilvl) if item_id is not None else (None, name)
+    key = _keys.get(identity)
+    if key is None or name < key.name:
+        with _keysLock:
+            key = _keys.setdefault(identity, ItemKey(item_id, ilvl, name))
+            if name < key.name:
+                key.name = name
+    return key
@@ -1,6 +1,9 @@
 #Store all droptimizer results for a player in a dict associated with that
-#player.
+#player.  sims and the delta matrices are keyed by ItemKey.
 class Player:
+    __slots__ = ("name", "spec", "sims", "multispec", "normal_bis", "normal_delta_matrix", "heroic_bis",
+                 "heroic_delta_matrix", "mythic_bis", "mythic_delta_matrix", "slot_index")
+
     def __init__(self, name, spec, multispec):
         self.name = name
         self.spec = spec
@@ -12,6 +15,8 @@ class Player:
         self.heroic_delta_matrix = {}
         self.mythic_bis = BestInSlot()
         self.mythic_delta_matrix = {}
+        #Built from sims once ingestion is done; see SlotIndex.
+        self.slot_index = None
     
     def __repr__(self):
         return f"{self.name} playing {self.spec}"
@@ -22,28 +27,77 @@ class BestInSlot:
                    "neck", "trinket", "waist", "finger", "off_hand", "shoulder", "main_hand", "back", "feet",
                    "wrist", "head", "hands", "legs", "chest"
                    ]
+    SLOT_POSITIONS = {slot: i for i, slot in enumerate(VALID_SLOTS)}
+    __slots__ = ("_gear",)
     
     def __init__(self):
         """Initialize all BiS slots with None (unknown initially)."""
-        self.bis_gear = {slot: None for slot in self.VALID_SLOTS}
+        #The BiS item per slot, in VALID_SLOTS order.
+        self._gear = [None] * len(self.VALID_SLOTS)
 
-    def set_bis(self, slot: str, item_name: str):
-        """Set the BiS item for a specific slot."""
-        if slot not in self.VALID_SLOTS:
+    def _position(self, slot):
+        position = self.SLOT_POSITIONS.get(slot)
+        if position is None:
             raise ValueError(f"Invalid gear slot: {slot}")
-        self.bis_gear[slot] = item_name
+        return position
+
+    def set_bis(self, slot: str, item):
+        """Set the BiS item for a specific slot."""
+        self._gear[self._position(slot)] = item
 
-    def get_bis(self, slot: str) -> str:
+    def get_bis(self, slot: str):
         """Retrieve the BiS item for a given slot."""
-        if slot not in self.VALID_SLOTS:
-            raise ValueError(f"Invalid gear slot: {slot}")
-        return self.bis_gear[slot]
+        return self._gear[self._position(slot)]
+
+    @property
+    def bis_gear(self):
+        return dict(zip(self.VALID_SLOTS, self._gear))
 
     def __repr__(self):
         """String representation of the BiS gear."""
         return "\n".join([f"{slot}: {item or 'Not Set'}" for slot, item in self.bis_gear.items()])
     
+#A player's two best sims for every (slot, source), so "best in slot" and
+#"best other item for this slot" don't need a walk over all of their sims.
+class SlotIndex:
+    __slots__ = ("top", "_added")
+
+    def __init__(self):
+        #(slot, source) -> up to two (value, order added, item), best first.
+        self.top = {}
+        self._added = 0
+
+    def add(self, slot, source, item, value):
+        """Add one sim.  Add them in sims order: equal values rank the earlier item first."""
+        entry = (value, self._added, item)
+        self._added += 1
+        entries = self.top.get((slot, source))
+        if entries is None:
+            self.top[(slot, source)] = [entry]
+        elif value > entries[0][0]:
+            entries.insert(0, entry)
+            del entries[2:]
+        elif len(entries) < 2 or value > entries[1][0]:
+            entries[1:] = [entry]
+
+    def slots(self):
+        return {slot for slot, _ in self.top}
+
+    def best(self, slot, sources, exclude=None):
+        """Return (value, order added, item) of the best item for slot from any of sources, ignoring exclude, or None."""
+        best = None
+        for source in sources:
+            for entry in self.top.get((slot, source), ()):
+                if entry[2] == exclude:
+                    continue
+                if best is None or entry[0] > best[0] or (entry[0] == best[0] and entry[1] < best[1]):
+                    best = entry
+                break
+        return best
+
 class ItemCandidate:
+    __slots__ = ("player", "item_val", "item_delta", "next_best_val", "candidate_reason")
+
     def __init__(self, player: Player, item_val: float, item_delta: float, next_best_val: float, candidate_reason: str):
         self.player = player
         self.item_val = item_val
@@ -52,4 +106,8 @@ class ItemCandidate:
         self.candidate_reason = candidate_reason
         
     def __repr__(self):
-        return f"{self.player} for {self.candidate_reason}, value is {self.item_val}."
\ No newline at end of file
+        return f"{self.player} for {self.candidate_reason}, value is {self.item_val}."
+
+#Pads every item's choices out to five.  Nothing changes a candidate once
+#it's made, so all the padding is this one object.
+NO_CANDIDATE = ItemCandidate(Player("No choice", None, None), 0, 0, 0, "No candidate")
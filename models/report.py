@@ -0,0 +1,35 @@
+#Everything one droptimizer/QE report contributes to the run, parsed on its own
+#so reports can be fetched in parallel and merged afterwards in simlist order.
+class ReportResult:
+    def __init__(self, url):
+        self.url = url
+        self.charname = None
+        self.spec = None
+        #(ItemKey, slot, source, boss) in the order the parser met them.  slot
+        #is None when the item should not be added to items (QE items wowhead
+        #could not name).
+        self.entries = []
+        #QE reports don't know their bosses; resolve them against itemBosses
+        #at merge time instead of using the boss column of entries.
+        self.resolve_bosses = False
+        #QE rows as (item ID, ilvl, source, percDiff), waiting for wowhead
+        #names.  All QE reports' item IDs are looked up in one batch before
+        #these are turned into entries and sims.
+        self.qe_items = []
+        #ItemKey -> % upgrade
+        self.sims = {}
+        self.error = None
+        #Set when the run's deadline went before this report was done.  It's
+        #left out of the results rather than merged half-finished.
+        self.timed_out = False
+
+    def add_entry(self, item, slot, source, boss=None):
+        self.entries.append((item, slot, source, boss))
+
+    def add_sim(self, item, value):
+        #Rings and trinkets get simmed once per slot; keep whichever is better.
+        if item not in self.sims or value > self.sims[item]:
+            self.sims[item] = value
+
+    def __repr__(self):
+        return f"{self.charname} ({self.spec}) from {self.url}"
@@ -0,0 +1,26 @@
+#What a run leaves behind for the next --incremental run: the item registries
+#and players it built from its reports, and the results worked out for those
+#players.  The next run recomputes only the players and items that new or
+#changed reports touch.  (The parsed reports themselves are in report_store.)
+RUN_STATE_VERSION = 5
+
+class RunState:
+    def __init__(self):
+        self.version = RUN_STATE_VERSION
+        #The --engine that worked the results out.  The numpy engine doesn't
+        #build slot indexes, so its players can't be reused by the dict one.
+        self.engine = None
+        #Copies of items, itemSources and itemBosses after merging.
+        self.items = {}
+        self.itemSources = {}
+        self.itemBosses = {}
+        #Players in merge order, with their BiS lists, delta matrices and
+        #slot indexes.
+        self.players = []
+        self.item_Choices = {}
+        #(name, spec) -> {(source, boss): [item count, sum of upgrades]} for
+        #the EV sheet.
+        self.ev_totals = {}
+
+    def __repr__(self):
+        return f"Run state with {len(self.players)} players and {len(self.items)} items"
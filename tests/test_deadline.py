@@ -0,0 +1,73 @@
+import http.server
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from utils.http_utils import set_deadline, current_deadline, with_deadline, deadline_remaining
+from utils.thread_utils import DaemonThreadPool
+
+DEADLINE = 2
+#How long the server takes to send a whole report artifact.  Every read
+#returns well inside the read timeout, so only the deadline stops it.
+DRIBBLE_SECONDS = 30
+
+class DribbleHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        end = time.monotonic() + DRIBBLE_SECONDS
+        try:
+            while time.monotonic() < end:
+                self.wfile.write(b"#")
+                self.wfile.flush()
+                time.sleep(0.2)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class DeadlineTest(unittest.TestCase):
+    def tearDown(self):
+        set_deadline(None)
+
+    def test_worker_keeps_its_deadline(self):
+        set_deadline(60)
+        deadline = current_deadline()
+        with DaemonThreadPool(1) as pool:
+            future = pool.submit(with_deadline(deadline, lambda: (time.sleep(0.2), current_deadline())[1]))
+            set_deadline(None)
+            self.assertEqual(future.result(), deadline)
+        self.assertIsNone(current_deadline())
+        self.assertIsNone(deadline_remaining())
+
+    def test_process_exits_at_deadline(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), DribbleHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with tempfile.TemporaryDirectory() as tmp:
+            simfile = os.path.join(tmp, "simlist.txt")
+            with open(simfile, "w") as f:
+                for n in range(3):
+                    f.write(f"Player{n} http://127.0.0.1:{server.server_port}/raidbots.com/reports/slow{n}/\n")
+            code = ("import sys; sys.path.insert(0, sys.argv[1]); import amilooted; "
+                    "sys.argv = ['amilooted.py', sys.argv[2], '--deadline', sys.argv[3], '--output', 'csv', "
+                    "'--headless']; amilooted.main()")
+            start = time.monotonic()
+            proc = subprocess.run([sys.executable, "-c", code, REPO, simfile, str(DEADLINE)], cwd=tmp,
+                                  capture_output=True, text=True, timeout=DRIBBLE_SECONDS)
+            elapsed = time.monotonic() - start
+        self.assertIn("Out of time", proc.stdout)
+        self.assertLess(elapsed, DEADLINE + 5, proc.stdout + proc.stderr)
+
+if __name__ == "__main__":
+    unittest.main()
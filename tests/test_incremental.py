@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import amilooted
+from models.item_key import item_key
+from models.report import ReportResult
+from utils.constants import NORMAL_RAID_SOURCE, HEROIC_RAID_SOURCE, MYTHIC_RAID_SOURCE
+from utils.matrix_engine import numpy_available
+
+ITEMS = [
+    (1001, "Crown of Tests 639", "head", HEROIC_RAID_SOURCE, "First Boss"),
+    (1002, "Helm of Asserts 639", "head", HEROIC_RAID_SOURCE, "Second Boss"),
+    (1003, "Band of Fixtures 639", "finger", HEROIC_RAID_SOURCE, "First Boss"),
+    (1004, "Idol of Mocks 626", "trinket", NORMAL_RAID_SOURCE, "Second Boss"),
+    (1005, "Charm of Stubs 652", "trinket", MYTHIC_RAID_SOURCE, "First Boss"),
+]
+
+def roster(changed):
+    #Three droptimizers over ITEMS; with changed, the second one is resimmed.
+    results = []
+    for n, (name, spec) in enumerate([("Tanky", "Protection"), ("Stabby", "Outlaw"), ("Heals", "Holy")]):
+        result = ReportResult(f"https://www.raidbots.com/reports/test{n}/")
+        result.charname, result.spec = name, spec
+        for i, (item_id, itemname, slot, source, boss) in enumerate(ITEMS):
+            key = item_key(item_id, itemname)
+            result.add_entry(key, slot, source, boss)
+            value = round(1.5 * ((n + 2 * i) % 5) - 1, 2)
+            if changed and n == 1:
+                value += 2
+            result.add_sim(key, value)
+        results.append(result)
+    return results
+
+def run(engine, state=None, changed=False):
+    #One run over the roster, like main(): returns the state it leaves behind
+    #and its output tables.
+    amilooted.reset_run_state()
+    amilooted.merge_reports(roster(changed))
+    ev_dictionary, evTotals = amilooted.compute_or_recompute(engine, state)
+    state = amilooted.snapshot_run_state(evTotals, engine)
+    amilooted.sort_players()
+    tables = [(table.name, table.columns, list(table.rows)) for table in amilooted.output_tables(ev_dictionary)]
+    return state, tables
+
+class IncrementalTest(unittest.TestCase):
+    def tearDown(self):
+        amilooted.reset_run_state()
+
+    def test_dict_after_dict(self):
+        state, _ = run("dict")
+        _, tables = run("dict", state, changed=True)
+        self.assertEqual(tables, run("dict", changed=True)[1])
+
+    @unittest.skipUnless(numpy_available(), "numpy is not installed")
+    def test_dict_after_numpy(self):
+        state, _ = run("numpy")
+        _, tables = run("dict", state, changed=True)
+        self.assertEqual(tables, run("dict", changed=True)[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import amilooted
+from models.report import ReportResult
+from utils.constants import HEROIC_RAID_SOURCE
+
+class NameQeItemsTest(unittest.TestCase):
+    def tearDown(self):
+        amilooted.reset_run_state()
+
+    def test_items_without_a_known_slot_are_skipped(self):
+        result = ReportResult("https://questionablyepic.com/live/upgradereport/test")
+        result.charname, result.spec = "Heals", "Holy"
+        result.resolve_bosses = True
+        result.qe_items = [(2001, "639", HEROIC_RAID_SOURCE, 1.5),
+                           (2002, "639", HEROIC_RAID_SOURCE, 2.5),
+                           (2003, "639", HEROIC_RAID_SOURCE, 3.5),
+                           (2004, "639", HEROIC_RAID_SOURCE, 4.5)]
+        iteminfo = {2001: ("Crown of Tests", "Head"),
+                    2002: ("Bow of Fixtures", "Ranged"),
+                    2003: ("Relic of Mocks", None)}
+        amilooted.name_qe_items([result], iteminfo)
+
+        self.assertEqual([(item.name, slot) for item, slot, source, boss in result.entries],
+                         [("Crown of Tests 639", "head")])
+        self.assertEqual([item.name for item in result.sims], ["Crown of Tests 639"])
+        self.assertIn("2002, 2003, 2004", result.error)
+
+        #The rest of the report still goes through the whole run.
+        amilooted.reset_run_state()
+        amilooted.merge_reports([result])
+        amilooted.compute_results("dict")
+        self.assertEqual(amilooted.players[0].heroic_bis.get_bis("head").name, "Crown of Tests 639")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import gzip
+import os
+import pickle
+import re
+import tempfile
+import threading
+from models.run_state import RUN_STATE_VERSION
+
+#Everything we keep between runs lives under here, next to the simlist.
+CACHE_DIR = ".amilooted_cache"
+DEFAULT_CACHE_MB = 256
+RUN_STATE_FILE = os.path.join(CACHE_DIR, "run_state.pickle")
+
+#Raidbots report hashes are plain alphanumerics; anything else doesn't get a
+#directory on disk.
+_REPORT_HASH = re.compile(r"[A-Za-z0-9]+")
+
+def get_raidbots_report_hash(url):
+    """
+    Extracts the report hash from a URL like:
+      https://www.raidbots.com/reports/<hash>/
+    Returns None if the URL doesn't look like a finished report.
+    """
+    parts = url.rstrip("/").split("/")
+    if len(parts) < 2 or parts[-2] != "reports":
+        return None
+    if not _REPORT_HASH.fullmatch(parts[-1]):
+        return None
+    return parts[-1]
+
+
+#Finished Raidbots reports never change, so their artifacts (input.txt,
+#data.csv, ...) can be kept forever.  Files are stored gzipped as
+#<root>/<report hash>/<artifact>.gz; when the cache grows past max_bytes the
+#least recently used files are removed.
+class ReportCache:
+    def __init__(self, root=os.path.join(CACHE_DIR, "reports"), max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        #Set by --refresh: ignore what's on disk, but still store fresh copies.
+        self.refresh = False
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, report_hash, artifact):
+        return os.path.join(self.root, report_hash, artifact + ".gz")
+
+    def iter_chunks(self, report_hash, artifact, chunk_size=65536):
+        """
+        Return an iterator over the decompressed bytes of a cached artifact,
+        or None on a miss.
+        """
+        if self.refresh or report_hash is None:
+            return None
+        path = self._path(report_hash, artifact)
+        try:
+            f = gzip.open(path, "rb")
+        except OSError:
+            return None
+        #Bump the mtime so eviction sees this as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return self._read_chunks(f, chunk_size)
+
+    @staticmethod
+    def _read_chunks(f, chunk_size):
+        with f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def writer(self, report_hash, artifact):
+        """
+        Start storing an artifact piece by piece.  Nothing is visible to
+        readers until commit(); discard() throws the partial copy away.
+        """
+        return _CacheWriter(self, self._path(report_hash, artifact))
+
+    def put(self, report_hash, artifact, data: bytes):
+        if report_hash is None:
+            return
+        writer = self.writer(report_hash, artifact)
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def _added(self, path):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for report_hash in os.listdir(self.root):
+            folder = os.path.join(self.root, report_hash)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if not name.endswith(".gz"):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        self._size = total
+
+
+#Compresses into a temp file next to the final one and renames it into place,
+#so a crash or a dropped connection never leaves a truncated artifact behind.
+class _CacheWriter:
+    def __init__(self, cache, path):
+        self._cache = cache
+        self._path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self._tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        self._raw = os.fdopen(fd, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb")
+
+    def write(self, data: bytes):
+        self._gz.write(data)
+
+    def _close(self):
+        self._gz.close()
+        self._raw.close()
+
+    def commit(self):
+        self._close()
+        os.replace(self._tmppath, self._path)
+        self._cache._added(self._path)
+
+    def discard(self):
+        try:
+            self._close()
+        finally:
+            try:
+                os.remove(self._tmppath)
+            except OSError:
+                pass
+
+
+def load_run_state(path=RUN_STATE_FILE):
+    """
+    Return the RunState the last run saved, or None if there isn't one (or it
+    can't be read, or was written by an older version).
+    """
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception:
+        return None
+    if getattr(state, "version", None) != RUN_STATE_VERSION:
+        return None
+    return state
+
+def save_run_state(state, path=RUN_STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmppath, path)
+    except BaseException:
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        raise
+
+
+report_cache = ReportCache()
@@ -0,0 +1,329 @@
+import codecs
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError as e:
+    raise ImportError("The requests library is needed to fetch reports; install it with "
+                      "'python -m pip install -r requirements.txt'") from e
+from utils.trace_utils import tracer
+
+#Number of reports fetched at once.  Raidbots and QE are happy with this many
+#connections from one client; raise it with --workers if they stay happy.
+DEFAULT_WORKERS = 8
+
+#One keep-alive session per host, shared by every fetch worker so a roster's
+#worth of reports reuses a handful of TLS connections instead of opening one
+#per request.
+_sessions = {}
+_sessions_lock = threading.Lock()
+_pool_size = DEFAULT_WORKERS
+
+#Requests in flight at once to one host, whatever is asking: report workers,
+#the QE pool and wowhead lookups all share these.  Hosts not listed get
+#--workers.  QE's API and wowhead answer small requests quickly and don't
+#mind a few more.
+HOST_CONCURRENCY = {
+    "questionablyepic.com": 8,
+    "www.wowhead.com": 12,
+}
+_host_slots = {}
+
+#Requests started per second, and how many can go out at once after a quiet
+#spell, per host.  Hosts not listed get DEFAULT_RATE.  These are what each
+#host takes without throttling us; a 429 halves a host's rate for a while
+#anyway (see TokenBucket).
+#Wowhead doesn't publish a limit, and every item is only ever looked up once
+#(metadata_store keeps the answer), so its bucket lets a cold batch of QE
+#items go straight out; HOST_CONCURRENCY is what bounds it, and a 429 slows
+#it down like any other host.
+HOST_RATES = {
+    "www.raidbots.com": (20, 20),
+    "questionablyepic.com": (8, 8),
+    "www.wowhead.com": (50, 200),
+    "docs.google.com": (5, 5),
+    "sheets.googleapis.com": (1, 10),
+}
+DEFAULT_RATE = (10, 10)
+#Throttling and server errors are retried this many times, waiting about
+#BACKOFF_BASE, 2 * BACKOFF_BASE, ... seconds (with jitter, or longer if the
+#host says Retry-After) in between.
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+#After this many failed attempts in a row a host gets no requests for
+#BREAKER_COOLDOWN seconds, then one to see if it's back.
+BREAKER_FAILURES = 8
+BREAKER_COOLDOWN = 30
+
+#Seconds to wait for a connection, and then for each read from it.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+class HostUnavailable(requests.RequestException):
+    pass
+
+class DeadlineExceeded(requests.RequestException):
+    pass
+
+#When (time.monotonic()) the run stops waiting for the network, or None.
+#Fetch workers carry their own copy (see with_deadline), so the next run
+#setting or clearing this doesn't change how long ones still going get.
+_deadline = None
+_local = threading.local()
+
+def set_deadline(seconds):
+    """Give every request from now on seconds to finish in, or None for no deadline."""
+    global _deadline
+    _deadline = None if seconds is None else time.monotonic() + seconds
+
+def current_deadline():
+    """The deadline requests on this thread are held to, or None."""
+    return getattr(_local, "deadline", _deadline)
+
+def with_deadline(deadline, fn):
+    #fn, held to deadline (a current_deadline()) on whatever thread it's
+    #called on.  Capture it when the work is handed to a pool.
+    def call(*args, **kwargs):
+        previous = getattr(_local, "deadline", None)
+        had_previous = hasattr(_local, "deadline")
+        _local.deadline = deadline
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if had_previous:
+                _local.deadline = previous
+            else:
+                del _local.deadline
+    return call
+
+def deadline_remaining():
+    """Seconds until the deadline (maybe negative), or None if there isn't one."""
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline(url=None):
+    #Raise DeadlineExceeded if the deadline has gone, otherwise return
+    #deadline_remaining().
+    left = deadline_remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("ran out of time" + (f" before {url}" if url else ""))
+    return left
+
+def _time_for(delay):
+    left = deadline_remaining()
+    return left is None or delay < left
+
+#Spaces out the requests to one host.  Callers take() a token before every
+#request and wait if there isn't one; tokens come back at rate per second, up
+#to burst.  A 429 halves the rate (down to an eighth of what's configured)
+#and every success wins a bit of it back, so we settle just under whatever
+#the host is willing to take today.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Wait for a token.  Returns how long that took, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            #Going negative reserves the next token, so waiters go in order.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 8, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def succeeded(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+#Stops sending requests to a host that keeps failing, so a roster's worth of
+#reports fails fast instead of each one waiting out its retries against a
+#host that's down.
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._failed = 0
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened is None:
+                return True
+            if time.monotonic() - self._opened < self.cooldown:
+                return False
+            #Let one request through; it either closes the breaker or opens
+            #it for another cooldown.
+            self._opened = time.monotonic()
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self._failed = 0
+                self._opened = None
+                return
+            self._failed += 1
+            if self._failed >= self.failures:
+                if self._opened is None:
+                    tracer.count("Circuit breaker trips")
+                self._opened = time.monotonic()
+
+_buckets = {}
+_breakers = {}
+
+def host_bucket(host):
+    with _sessions_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(*HOST_RATES.get(host, DEFAULT_RATE))
+    return bucket
+
+def host_breaker(host):
+    with _sessions_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+    return breaker
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE):
+    #Exponential with half of it jittered, so retries from many workers don't
+    #all land at once.  A Retry-After in seconds wins if it's longer.
+    delay = base * 2 ** attempt
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None and str(retry_after).isdigit():
+        delay = max(delay, int(retry_after))
+    return min(delay, MAX_BACKOFF)
+
+def set_pool_size(workers):
+    global _pool_size
+    _pool_size = max(1, workers)
+    with _sessions_lock:
+        _host_slots.clear()
+
+def host_concurrency(host):
+    return HOST_CONCURRENCY.get(host, _pool_size)
+
+def _host_slot(host):
+    with _sessions_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(host_concurrency(host))
+    return slot
+
+def get_session(url):
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=host_concurrency(host))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+    return session
+
+def http_get(url, **kwargs):
+    #Every request to a host waits for a token from its bucket and one of its
+    #slots.  429s, 5xx and connection errors are retried with backoff; if
+    #they keep coming the last response is returned (or the error raised),
+    #and the host's circuit breaker may open, after which requests to it
+    #raise HostUnavailable until the cooldown is up.
+    #Requests time out after CONNECT_TIMEOUT/READ_TIMEOUT unless the caller
+    #says otherwise, and never wait past the run's deadline: once it's gone
+    #they raise DeadlineExceeded, and a retry that wouldn't start before it
+    #isn't made.
+    #A streamed request gives its slot back once the headers are in, and the
+    #span's latency is up to there too; bytes is what the server says it'll
+    #send.  Whoever reads the stream can trace that part (and should read it
+    #through before_deadline()).
+    host = urlsplit(url).netloc
+    session = get_session(url)
+    bucket = host_bucket(host)
+    breaker = host_breaker(host)
+    timeouts = kwargs.pop("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    connect_timeout, read_timeout = timeouts if isinstance(timeouts, tuple) else (timeouts, timeouts)
+    with tracer.span(host, "http", url=url) as span:
+        for attempt in range(MAX_RETRIES + 1):
+            span.args["attempts"] = attempt + 1
+            left = check_deadline(url)
+            if not breaker.allow():
+                raise HostUnavailable(f"{host} is failing; not trying {url} for now")
+            bucket.take()
+            timeout = (connect_timeout, read_timeout) if left is None else \
+                      (min(connect_timeout, left), min(read_timeout, left))
+            try:
+                with _host_slot(host):
+                    resp = session.get(url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                breaker.record(False)
+                delay = backoff_delay(attempt)
+                if attempt == MAX_RETRIES or not _time_for(delay):
+                    raise
+            else:
+                span.args["status"] = resp.status_code
+                if resp.status_code not in RETRY_STATUSES:
+                    breaker.record(True)
+                    bucket.succeeded()
+                    break
+                breaker.record(False)
+                if resp.status_code == 429:
+                    bucket.throttled()
+                delay = backoff_delay(attempt, resp.headers.get("Retry-After"))
+                if attempt == MAX_RETRIES or not _time_for(delay):
+                    break
+                resp.close()
+            tracer.count("HTTP retries")
+            time.sleep(delay)
+        if kwargs.get("stream"):
+            span.args["bytes"] = int(resp.headers.get("Content-Length", 0) or 0)
+        else:
+            span.args["bytes"] = len(resp.content)
+    return resp
+
+def before_deadline(chunks, url=None):
+    #Pass a streamed body through, raising DeadlineExceeded between chunks
+    #once the deadline has gone.  Timeouts only bound each read, and a slow
+    #enough server could drip a report out for ever.
+    for chunk in chunks:
+        check_deadline(url)
+        yield chunk
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def iter_lines(chunks):
+    #Turn a stream of byte chunks into lines, splitting exactly like
+    #text.split("\n") would (including the piece after the last newline, even
+    #if it's empty), without ever holding more than one line of text.
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if "\n" in pending:
+            *complete, pending = pending.split("\n")
+            yield from complete
+    yield pending + decoder.decode(b"", final=True)
@@ -1,51 +1,149 @@
+import hashlib
+import importlib.util
+import json
 import os.path
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
+import time
+from utils.cache_utils import CACHE_DIR
+from utils.http_utils import backoff_delay, host_bucket
+from utils.trace_utils import tracer
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 SERVICE_ACCOUNT_FILE = 'credentials.json'  # Or your service account file
 
+#The Google client libraries are only needed to publish, and take a while to
+#import, so they're imported when a Sheets service is first asked for.
+def sheets_available():
+    return importlib.util.find_spec("googleapiclient") is not None and \
+           importlib.util.find_spec("google.oauth2") is not None
+
+#Built once per process; watch mode publishes through the same one every
+#time.
+_service = None
+
 def get_sheets_service():
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    service = build('sheets', 'v4', credentials=creds)
-    return service
-
-def write_to_sheet(service, spreadsheet_id, sheet_name, values):
-    body = {
-        'values': values
-    }
-    range_name = f"{sheet_name}!A1"
-    service.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id, range=range_name,
-        valueInputOption="RAW", body=body).execute()
-    
-def clear_sheet(service, spreadsheet_id, sheet_name):
-    # Get the sheet ID from the sheet name
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    sheet_id = None
-    for s in spreadsheet['sheets']:
-        if s['properties']['title'] == sheet_name:
-            sheet_id = s['properties']['sheetId']
-            break
-    if sheet_id is None:
-        raise ValueError(f"Sheet '{sheet_name}' not found.")
-
-    # Clear values
-    service.spreadsheets().values().clear(
-        spreadsheetId=spreadsheet_id,
-        range=f"{sheet_name}"
-    ).execute()
-
-    # Clear formatting and filters
-    requests_body = [
-        {"updateCells": {
-            "range": {"sheetId": sheet_id},
+    global _service
+    if _service is None:
+        from googleapiclient.discovery import build
+        from google.oauth2 import service_account
+        creds = service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+        _service = build('sheets', 'v4', credentials=creds)
+    return _service
+
+#What each tab looked like when we last published it, so --only-changed can
+#leave tabs alone that would be rewritten with the same contents.
+PUBLISHED_FILE = os.path.join(CACHE_DIR, "published.json")
+#Rows per range in values.batchUpdate, and cells per call; anything bigger
+#goes out in several calls.
+ROWS_PER_RANGE = 1000
+CELLS_PER_REQUEST = 200000
+#Quota errors and server hiccups are retried this many times, waiting about
+#1, 2, 4, ... seconds (with jitter, see http_utils.backoff_delay) in between.
+#Requests also share the Sheets API's token bucket, so a 429 slows every
+#later one down too.
+SHEETS_HOST = "sheets.googleapis.com"
+MAX_RETRIES = 6
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def execute_with_backoff(request):
+    from googleapiclient.errors import HttpError
+    with tracer.span(getattr(request, "methodId", None) or "sheets request", "sheets") as span:
+        bucket = host_bucket(SHEETS_HOST)
+        for attempt in range(MAX_RETRIES + 1):
+            span.args["attempts"] = attempt + 1
+            bucket.take()
+            try:
+                return request.execute()
+            except HttpError as e:
+                status = getattr(e.resp, "status", None)
+                span.args["status"] = status
+                if status is None or int(status) not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    raise
+                if int(status) == 429:
+                    bucket.throttled()
+                tracer.count("Google Sheets retries")
+                retry_after = e.resp.get("retry-after") if hasattr(e.resp, "get") else None
+                delay = backoff_delay(attempt, retry_after, base=1)
+                print(f"Google Sheets returned {status}; retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+def _tab_hash(values):
+    return hashlib.sha256(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+def _load_published(spreadsheet_id):
+    try:
+        with open(PUBLISHED_FILE, encoding="utf-8") as f:
+            return json.load(f).get(spreadsheet_id, {})
+    except (OSError, ValueError):
+        return {}
+
+def _save_published(spreadsheet_id, hashes):
+    try:
+        with open(PUBLISHED_FILE, encoding="utf-8") as f:
+            published = json.load(f)
+    except (OSError, ValueError):
+        published = {}
+    published[spreadsheet_id] = hashes
+    os.makedirs(os.path.dirname(PUBLISHED_FILE), exist_ok=True)
+    tmppath = PUBLISHED_FILE + ".tmp"
+    with open(tmppath, "w", encoding="utf-8") as f:
+        json.dump(published, f)
+    os.replace(tmppath, PUBLISHED_FILE)
+
+def _value_ranges(sheet_name, values):
+    for start in range(0, len(values), ROWS_PER_RANGE):
+        yield {"range": f"{sheet_name}!A{start + 1}", "values": values[start:start + ROWS_PER_RANGE]}
+
+def publish_sheets(service, spreadsheet_id, tabs, only_changed=False):
+    """
+    Replace the contents of several tabs at once.  tabs is {sheet name: rows}.
+    Every tab's formatting, filter and values are cleared and its rows
+    written, in one spreadsheets().get, one batchUpdate, one values.batchClear
+    and as few values.batchUpdate calls as the size allows.  With only_changed, tabs
+    whose rows are the same as the last time they were published here are
+    skipped.  Returns the names of the tabs that were written.
+    """
+    hashes = {name: _tab_hash(values) for name, values in tabs.items()}
+    published = _load_published(spreadsheet_id)
+    if only_changed:
+        tabs = {name: values for name, values in tabs.items() if published.get(name) != hashes[name]}
+    if not tabs:
+        return []
+
+    spreadsheet = execute_with_backoff(service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,title)"))
+    sheet_ids = {s['properties']['title']: s['properties']['sheetId'] for s in spreadsheet['sheets']}
+    for sheet_name in tabs:
+        if sheet_name not in sheet_ids:
+            raise ValueError(f"Sheet '{sheet_name}' not found.")
+
+    #Clear formatting and filters, then values, then write.
+    requests_body = []
+    for sheet_name in tabs:
+        requests_body.append({"updateCells": {
+            "range": {"sheetId": sheet_ids[sheet_name]},
             "fields": "userEnteredFormat"
-        }},
-        {"clearBasicFilter": {"sheetId": sheet_id}}
-    ]
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body={"requests": requests_body}
-    ).execute()
+        }})
+        requests_body.append({"clearBasicFilter": {"sheetId": sheet_ids[sheet_name]}})
+    execute_with_backoff(service.spreadsheets().batchUpdate(
+        spreadsheetId=spreadsheet_id, body={"requests": requests_body}))
+    execute_with_backoff(service.spreadsheets().values().batchClear(
+        spreadsheetId=spreadsheet_id, body={"ranges": list(tabs)}))
+
+    data, cells = [], 0
+    for sheet_name, values in tabs.items():
+        for value_range in _value_ranges(sheet_name, values):
+            size = sum(len(row) for row in value_range["values"])
+            if data and cells + size > CELLS_PER_REQUEST:
+                execute_with_backoff(service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id, body={"valueInputOption": "RAW", "data": data}))
+                data, cells = [], 0
+            data.append(value_range)
+            cells += size
+    if data:
+        execute_with_backoff(service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={"valueInputOption": "RAW", "data": data}))
+
+    published.update({name: hashes[name] for name in tabs})
+    _save_published(spreadsheet_id, published)
+    return list(tabs)
@@ -1,52 +1,148 @@
-from utils.constants import tiernames, sourcesLookup, slotdict, bossesList
+from models.item_key import item_key
+from utils.constants import tiernames, sourcesLookup, slotdict, bossesList, encounterBosses
+from utils.tier_matcher import TierMatcher
+from utils.trace_utils import tracer
 
 qeWeaponSlots = ["One-Hand", "Ranged", "Two-Hand"]
 items = {}
 itemSources = {}
 itemBosses = {}
 
-def tierfilter(itemname, key):
-    if tiercheck(itemname):
-        ilvl = itemname.split()[-1]
-        slot = key.rstrip("/").split("/")[-1]
+#Every class's tier piece for a slot is merged into one item, e.g. "Tier
+#Helmet 441"; these are their made-up item IDs.
+TIER_PIECE_IDS = {piece: -(i + 1) for i, piece in enumerate(sorted(set(slotdict.values())))}
+TIER_ITEM_IDS = frozenset(TIER_PIECE_IDS.values())
+
+def tier_item_key(itemname, key):
+    #itemname is a tier piece's name from input.txt, key its profileset name.
+    ilvl = itemname.split()[-1]
+    slot = key.rstrip("/").split("/")[-1]
+    try:
         piece = slot_to_piece(slot)
-        return "Tier " + piece + " " + ilvl
-    return itemname
+    except KeyError:
+        count_lookup_miss("Tier piece slot not resolved", key)
+        raise
+    return item_key(TIER_PIECE_IDS[piece], "Tier " + piece + " " + ilvl)
 
-def add_to_items(itemname, itemSlot: str):
-    if itemname in items:
+def add_to_items(item, itemSlot: str):
+    if item in items:
         return
-    items[itemname] = itemSlot.lower()
+    items[item] = itemSlot.lower()
+
+#Lookups that fell back to, or failed, the name scan.  Counted on the tracer
+#instead of printed per item; print_lookup_misses() reports them once at the
+#end.
+LOOKUP_MISSES = ("Unknown item source", "Encounter ID disagreed with boss name", "Boss drop for item not found",
+                 "Tier piece slot not resolved")
+
+def count_lookup_miss(kind, inputString):
+    tracer.count(kind, example=inputString)
+
+def print_lookup_misses():
+    for kind, count in list(tracer.counters.items()):
+        if kind in LOOKUP_MISSES:
+            print(f"{kind}: {count} item(s), e.g. {tracer.examples[kind]}")
+
+def profileset_fields(profileset):
+    #Profileset names look like 1273/2607/raid-normal/212388/597/0/trinket1/
+    #(instance, encounter, difficulty, item ID, ...).  Accepts the name or the
+    #whole profileset."..."+=... line; returns (encounter ID, difficulty token).
+    if profileset is None:
+        return None, None
+    if '"' in profileset:
+        profileset = profileset.split('"', 2)[1]
+    parts = profileset.split("/", 3)
+    if len(parts) < 3:
+        return None, None
+    try:
+        encounter = int(parts[1])
+    except ValueError:
+        encounter = None
+    return encounter, parts[2]
+
+def profileset_item_id(profileset):
+    #The fourth field of a profileset name, as for profileset_fields().
+    if profileset is None:
+        return None
+    if '"' in profileset:
+        profileset = profileset.split('"', 2)[1]
+    parts = profileset.split("/", 4)
+    if len(parts) < 4:
+        return None
+    try:
+        return int(parts[3])
+    except ValueError:
+        return None
 
 def find_item_source(inputString):
+    #The difficulty token maps straight to a source; scan for one of the
+    #known tokens only if that field isn't one.
+    mapped = sourcesLookup.get(profileset_fields(inputString)[1])
+    if mapped is not None:
+        return mapped
     for substring, mapped in sourcesLookup.items():
         if substring in inputString:
             return mapped
+    count_lookup_miss("Unknown item source", inputString)
 
-def add_to_item_sources(itemname, itemSource):
-    if itemname in itemSources:
+def add_to_item_sources(item, itemSource):
+    if item in itemSources:
         return
-    itemSources[itemname] = itemSource
+    itemSources[item] = itemSource
+
+#Encounter IDs whose encounterBosses entry has been checked against an item
+#comment this run, and the boss to use for them from now on.
+_checkedEncounters = {}
 
-def find_item_boss(inputString):
+def find_boss_by_name(inputString):
     for boss in bossesList:
         if boss in inputString:
             return boss
-    print("Boss drop for item not found, inputString:" + inputString)
-
-def resolve_qe_item_boss(inputString: str):
-    import re
-    truncated_input = re.sub(r'\d{3}$', '', inputString).rstrip()
-    for key, value in itemBosses.items():
-        truncated_key = re.sub(r'\d{3}$', '', key).rstrip()
-        if truncated_key == truncated_input:
-            return value
-    return "Unkown Boss"
-
-def add_to_item_bosses(itemName, bossName):
-    if itemName in itemBosses:
+
+def find_item_boss(inputString, profileset=None):
+    #inputString is the item's comment line from input.txt, profileset its
+    #profileset name or line.  Known encounter IDs resolve with one lookup;
+    #the first time each one is seen it's checked against the boss named in
+    #the comment, which wins if the two disagree.
+    encounter = profileset_fields(profileset)[0]
+    boss = _checkedEncounters.get(encounter)
+    if boss is not None:
+        return boss
+    named = find_boss_by_name(inputString)
+    boss = encounterBosses.get(encounter)
+    if boss is not None:
+        if named is not None and named != boss:
+            count_lookup_miss("Encounter ID disagreed with boss name", inputString)
+            boss = named
+        _checkedEncounters[encounter] = boss
+        return boss
+    if named is None:
+        count_lookup_miss("Boss drop for item not found", inputString)
+    return named
+
+#Item IDs mapped to the boss of the first itemBosses entry for that item at
+#any item level.  Kept in step by add_to_item_bosses() so QE items (which
+#don't know their boss) resolve with one dict lookup.
+itemBossesById = {}
+
+def resolve_qe_item_boss(item):
+    return itemBossesById.get(item.item_id, "Unkown Boss")
+
+def add_to_item_bosses(item, bossName):
+    if item in itemBosses:
         return
-    itemBosses[itemName] = bossName
+    itemBosses[item] = bossName
+    if item.item_id is not None:
+        itemBossesById.setdefault(item.item_id, bossName)
+
+def reset_item_registries():
+    #Everything above that a run fills in, for starting a new run in the
+    #same process.
+    items.clear()
+    itemSources.clear()
+    itemBosses.clear()
+    itemBossesById.clear()
+    _checkedEncounters.clear()
 
 def escape_csv_field(field):
     field = field.replace('"', '""')
@@ -78,11 +174,11 @@ def standardize_qe_item_slot(slot: str) -> str:
     # Try to match by key, fallback to original
     return mapping.get(slot, slot)
 
+#Built once from the set names in data/tier_keywords.json.
+tier_matcher = TierMatcher(tiernames)
+
 def tiercheck(itemname):
-    for t in tiernames:
-        if t in itemname:
-            return True
-    return False
+    return tier_matcher.is_tier(itemname)
 
 def slot_to_piece(slot):
     return slotdict[slot]
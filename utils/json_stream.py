@@ -0,0 +1,133 @@
+import codecs
+import json
+import re
+
+#Just enough of a JSON reader to pull one value out of a large document
+#(raidbots' data.json) without holding, or even downloading, the whole thing.
+#Everything that isn't on the way to the value we want is skipped unparsed,
+#and reading stops as soon as the value has been seen.
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+#Rest of a string after its opening quote, up to and including the closing
+#quote.  Fails to match if the string runs off the end of what we've read.
+_STRING_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+_SCALAR = re.compile(r"[^,\]}\s]+")
+
+
+class _Reader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _more(self):
+        #Pull the next chunk, dropping everything before the current position.
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                self._buf = self._buf[self._pos:] + text
+                self._pos = 0
+                return True
+        self._eof = True
+        return False
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                raise ValueError("JSON document ended early")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON, found {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    def _string(self, keep):
+        self._expect('"')
+        while True:
+            match = _STRING_REST.match(self._buf, self._pos)
+            if match:
+                raw = self._buf[self._pos:match.end() - 1]
+                self._pos = match.end()
+                return json.loads('"' + raw + '"') if keep else None
+            if not self._more():
+                raise ValueError("JSON string never ends")
+
+    def _scalar(self, keep):
+        self._peek()
+        while True:
+            match = _SCALAR.match(self._buf, self._pos)
+            #A number cut off at the end of a chunk might keep going.
+            if match and (match.end() < len(self._buf) or self._eof):
+                self._pos = match.end()
+                return json.loads(match.group()) if keep else None
+            if not self._more() and not match:
+                raise ValueError("JSON value never ends")
+
+    def _members(self, close):
+        #Yield once per member of the object/array we're positioned in,
+        #leaving the caller to consume each member's value.
+        self._pos += 1
+        if self._peek() == close:
+            self._pos += 1
+            return
+        while True:
+            yield
+            char = self._peek()
+            self._pos += 1
+            if char == close:
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or {close!r} in JSON, found {char!r}")
+
+    def skip(self):
+        char = self._peek()
+        if char == "{":
+            for _ in self._members("}"):
+                self._string(False)
+                self._expect(":")
+                self.skip()
+        elif char == "[":
+            for _ in self._members("]"):
+                self.skip()
+        elif char == '"':
+            self._string(False)
+        else:
+            self._scalar(False)
+
+    def find(self, path):
+        char = self._peek()
+        if not path:
+            if char == '"':
+                return self._string(True)
+            if char in "{[":
+                raise ValueError("Only strings, numbers and literals can be streamed out")
+            return self._scalar(True)
+        step = path[0]
+        if char == "{" and isinstance(step, str):
+            for _ in self._members("}"):
+                key = self._string(True)
+                self._expect(":")
+                if key == step:
+                    return self.find(path[1:])
+                self.skip()
+        elif char == "[" and isinstance(step, int):
+            for index, _ in enumerate(self._members("]")):
+                if index == step:
+                    return self.find(path[1:])
+                self.skip()
+        raise KeyError(step)
+
+
+def read_json_path(chunks, path):
+    """
+    Return the value at path (e.g. ("sim", "players", 0, "specialization"))
+    from a JSON document arriving as an iterable of bytes/str chunks.  Stops
+    consuming chunks as soon as the value has been read.  Raises KeyError if
+    the path isn't in the document.
+    """
+    return _Reader(chunks).find(tuple(path))
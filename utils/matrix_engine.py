@@ -0,0 +1,186 @@
+#Optional NumPy engine for the BiS, delta and choice stages (--engine numpy).
+#
+#All of the roster's sims go into one players x items matrix, kept as the
+#list of filled cells in (player, sims order) order, with integer slot and
+#source codes per item.  Best in slot, next best and the top candidates per
+#item then come from sorting and grouping those cells once per difficulty,
+#instead of walking every player's dicts once per item.
+#
+#Results have to be exactly those of the dict path in amilooted.py, ties
+#included, so every sort here is a stable lexsort with the same tie-breakers
+#the dict code gets from insertion order: the earlier item in a player's sims
+#wins a slot, the earlier player wins a candidate spot.
+import importlib.util
+from models.player import ItemCandidate, NO_CANDIDATE
+from utils.constants import (NORMAL_RAID_SOURCE, HEROIC_RAID_SOURCE, MYTHIC_RAID_SOURCE, DUNGEON_SOURCE,
+                             CRAFTED_SOURCE, DELVES_SOURCE, BIS_REASON, UPGRADE_PCT_REASON, bisSources,
+                             alwaysAvailableSources)
+
+#numpy takes longer to import than the rest of the program put together, so
+#it's only imported once an UpgradeMatrix is made.
+np = None
+
+def numpy_available():
+    return np is not None or importlib.util.find_spec("numpy") is not None
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+def _group_starts(*keys):
+    #keys are sorted together; True where a new run of equal keys begins.
+    starts = np.zeros(len(keys[0]), dtype=bool)
+    starts[:1] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+    return starts
+
+def _groups(indices, key):
+    #Split indices (sorted by key first) into one array per value of key.
+    if len(indices) == 0:
+        return []
+    return np.split(indices, np.flatnonzero(_group_starts(key[indices]))[1:])
+
+class UpgradeMatrix:
+    def __init__(self, players, items, itemSources):
+        load_numpy()
+        self.players = players
+        self.itemnames = list(items.keys())
+        itemindex = {item: i for i, item in enumerate(self.itemnames)}
+        self.slotnames = sorted(set(items.values()))
+        slotindex = {slot: s for s, slot in enumerate(self.slotnames)}
+        #Tier pieces with several sources (a set) and unknown sources get -1,
+        #which no difficulty's source lists contain.
+        self.sourcenames = sorted({source for source in itemSources.values() if isinstance(source, str)})
+        sourceindex = {source: c for c, source in enumerate(self.sourcenames)}
+        self.item_slot = np.array([slotindex[items[item]] for item in self.itemnames], dtype=np.int64)
+        self.item_source = np.array([sourceindex.get(itemSources.get(item), -1)
+                                     if isinstance(itemSources.get(item), str) else -1
+                                     for item in self.itemnames], dtype=np.int64)
+
+        #The filled cells of the matrix, in (player, sims order) order.
+        cell_player, cell_item, cell_value = [], [], []
+        for p, player in enumerate(players):
+            for item, value in player.sims.items():
+                cell_player.append(p)
+                cell_item.append(itemindex[item])
+                cell_value.append(value)
+        self.cell_player = np.array(cell_player, dtype=np.int64)
+        self.cell_item = np.array(cell_item, dtype=np.int64)
+        self.cell_value = np.array(cell_value, dtype=np.float64)
+        self.cell_order = np.arange(len(cell_item), dtype=np.int64)
+        self.cell_slot = self.item_slot[self.cell_item]
+        self.cell_source = self.item_source[self.cell_item]
+
+        #Per difficulty: (bis cell per player x slot, -1 if none) and the
+        #delta of every cell that counts towards that difficulty.
+        self.bis = {}
+        self.deltas = {}
+
+    def _codes(self, sources):
+        return [self.sourcenames.index(source) for source in sources if source in self.sourcenames]
+
+    def _ranked(self, sources):
+        #Cells whose source is in sources, ordered by (player, slot), best
+        #value first, earlier in sims first on equal values.
+        cells = np.flatnonzero(np.isin(self.cell_source, self._codes(sources)))
+        order = np.lexsort((self.cell_order[cells], -self.cell_value[cells],
+                            self.cell_slot[cells], self.cell_player[cells]))
+        cells = cells[order]
+        starts = _group_starts(self.cell_player[cells], self.cell_slot[cells])
+        return cells, starts
+
+    def _table(self, cells):
+        table = np.full((len(self.players), len(self.slotnames)), -1, dtype=np.int64)
+        table[self.cell_player[cells], self.cell_slot[cells]] = cells
+        return table
+
+    def populate_bis_lists(self):
+        bis_lists = {NORMAL_RAID_SOURCE: "normal_bis", HEROIC_RAID_SOURCE: "heroic_bis",
+                     MYTHIC_RAID_SOURCE: "mythic_bis"}
+        for difficulty, attr in bis_lists.items():
+            cells, starts = self._ranked(bisSources[difficulty])
+            leaders = cells[starts]
+            self.bis[difficulty] = self._table(leaders)
+            for p, s, i in zip(self.cell_player[leaders].tolist(), self.cell_slot[leaders].tolist(),
+                               self.cell_item[leaders].tolist()):
+                getattr(self.players[p], attr).set_bis(self.slotnames[s], self.itemnames[i])
+
+    def build_delta_matrices(self):
+        matrices = {NORMAL_RAID_SOURCE: "normal_delta_matrix", HEROIC_RAID_SOURCE: "heroic_delta_matrix",
+                    MYTHIC_RAID_SOURCE: "mythic_delta_matrix"}
+        for difficulty, attr in matrices.items():
+            cells = np.flatnonzero(np.isin(self.cell_source, self._codes(bisSources[difficulty])))
+            bis = self.bis[difficulty][self.cell_player[cells], self.cell_slot[cells]]
+            delta = np.full(len(self.cell_value), np.nan)
+            delta[cells] = self.cell_value[cells] - self.cell_value[bis]
+            self.deltas[difficulty] = delta
+            #cells are in sims order, so the dicts fill in the same order as
+            #build_delta_matrices() fills them.
+            for p, i, d in zip(self.cell_player[cells].tolist(), self.cell_item[cells].tolist(),
+                               delta[cells].tolist()):
+                getattr(self.players[p], attr)[self.itemnames[i]] = d
+
+    def _next_best(self, difficulty, cells):
+        #The best other item for each cell's (player, slot) from the sources
+        #always on offer plus this difficulty: the group's leader, or the
+        #runner-up when the cell is the leader.  -1 if there's none.
+        ranked, starts = self._ranked(alwaysAvailableSources + (difficulty,))
+        first = self._table(ranked[starts])
+        seconds = np.zeros(len(ranked), dtype=bool)
+        seconds[1:] = starts[:-1] & ~starts[1:]
+        second = self._table(ranked[seconds])
+        p, s = self.cell_player[cells], self.cell_slot[cells]
+        return np.where(first[p, s] == cells, second[p, s], first[p, s])
+
+    def _candidates(self, difficulty):
+        #(item index -> list of (cell, next best cell, reason)) for every item
+        #of this difficulty, at most five each.
+        code = self._codes((difficulty,))
+        cells = np.flatnonzero(np.isin(self.cell_source, code) & (self.cell_value > 0))
+        nextbest = self._next_best(difficulty, cells)
+        value = self.cell_value[cells]
+        nextvalue = np.where(nextbest >= 0, self.cell_value[np.maximum(nextbest, 0)], 0.0)
+        itemdelta = value - nextvalue
+        is_bis = (self.deltas[difficulty][cells] == 0) & (value > nextvalue)
+        item = self.cell_item[cells]
+        player = self.cell_player[cells]
+
+        picked = {}
+        bis = np.flatnonzero(is_bis)
+        bis = bis[np.lexsort((player[bis], -itemdelta[bis], item[bis]))]
+        for group in _groups(bis, item):
+            picked[int(item[group[0]])] = [(j, BIS_REASON) for j in group[:5].tolist()]
+
+        #Everyone else who'd gain from it fills the remaining spots, by value
+        #and then by how much they'd gain over their next best.
+        rest = np.flatnonzero(~is_bis)
+        rest = rest[np.lexsort((player[rest], -itemdelta[rest], -value[rest], item[rest]))]
+        for group in _groups(rest, item):
+            choices = picked.setdefault(int(item[group[0]]), [])
+            if len(choices) < 5:
+                choices.extend((j, UPGRADE_PCT_REASON) for j in group[:5 - len(choices)].tolist())
+        return {i: [(int(cells[j]), int(nextbest[j]), reason) for j, reason in choices]
+                for i, choices in picked.items()}
+
+    def create_choices(self, item_Choices):
+        picked = {}
+        for difficulty in (NORMAL_RAID_SOURCE, HEROIC_RAID_SOURCE, MYTHIC_RAID_SOURCE):
+            if difficulty in self.sourcenames:
+                picked.update(self._candidates(difficulty))
+        skipped = self._codes((DUNGEON_SOURCE, CRAFTED_SOURCE, DELVES_SOURCE))
+        for i in sorted(range(len(self.itemnames)), key=self.itemnames.__getitem__):
+            if self.item_source[i] in skipped:
+                continue
+            choices = []
+            for cell, nextbest, reason in picked.get(i, ()):
+                player = self.players[int(self.cell_player[cell])]
+                item_val = player.sims[self.itemnames[i]]
+                next_best = player.sims[self.itemnames[self.cell_item[nextbest]]] if nextbest >= 0 else 0
+                choices.append(ItemCandidate(player, item_val, item_val - next_best, next_best, reason))
+            while len(choices) < 5:
+                choices.append(NO_CANDIDATE)
+            item_Choices[self.itemnames[i]] = choices
@@ -0,0 +1,199 @@
+import importlib.util
+import os
+import tempfile
+from utils.item_utils import escape_csv_field
+from utils.io_utils import get_sheets_service, publish_sheets
+
+#Where a run's tables can go; --output picks any number of these.
+OUTPUTS = ["sheets", "csv", "parquet"]
+
+#pyarrow is slow to import; it's only imported once a ParquetSink is made.
+pa = None
+pq = None
+
+def parquet_available():
+    return pa is not None or importlib.util.find_spec("pyarrow") is not None
+
+def load_pyarrow():
+    global pa, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+    return pa
+
+
+#One output table: a spreadsheet tab and a local file.  rows is consumed once,
+#as the sinks write it.  The EV tab has never had a header row in the
+#spreadsheet, so columns_in_sheet leaves it out there (files always get one).
+class OutputTable:
+    def __init__(self, name, filename, columns, rows, columns_in_sheet=True):
+        self.name = name
+        self.filename = filename
+        self.columns = columns
+        self.rows = rows
+        self.columns_in_sheet = columns_in_sheet
+
+    def __repr__(self):
+        return f"{self.name} ({self.filename})"
+
+
+#Sinks get each table's rows one at a time: open_table(), write_row() for
+#every row, then close_table(), or abort_table() if building the rows failed.
+#close() runs once every table is done.
+class OutputSink:
+    def open_table(self, table: OutputTable):
+        pass
+
+    def write_row(self, row):
+        pass
+
+    def close_table(self):
+        pass
+
+    def abort_table(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def write_tables(tables, sinks):
+    """Stream every table's rows to every sink as they're built."""
+    for table in tables:
+        for sink in sinks:
+            sink.open_table(table)
+        try:
+            for row in table.rows:
+                for sink in sinks:
+                    sink.write_row(row)
+        except BaseException:
+            for sink in sinks:
+                sink.abort_table()
+            raise
+        for sink in sinks:
+            sink.close_table()
+    for sink in sinks:
+        sink.close()
+
+
+#Base for sinks that write one local file per table.  Each file is written to
+#a temp file next to it and renamed into place when the table is complete,
+#so an interrupted run never leaves a half-written file behind.
+class FileSink(OutputSink):
+    extension = ""
+
+    def __init__(self, directory=".", suffix=""):
+        self.directory = directory
+        #Appended to every file name, e.g. the run's date.
+        self.suffix = suffix
+        self.written = []
+        self._path = None
+        self._tmppath = None
+
+    def open_table(self, table: OutputTable):
+        self._path = os.path.join(self.directory, table.filename + self.suffix + self.extension)
+        fd, self._tmppath = tempfile.mkstemp(dir=self.directory or ".", suffix=".tmp")
+        self._open(fd, table)
+
+    def close_table(self):
+        self._finish()
+        os.replace(self._tmppath, self._path)
+        self.written.append(self._path)
+
+    def abort_table(self):
+        try:
+            self._finish()
+        finally:
+            try:
+                os.remove(self._tmppath)
+            except OSError:
+                pass
+
+    def _open(self, fd, table):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class CsvSink(FileSink):
+    extension = ".csv"
+    BUFFER_BYTES = 1024 * 1024
+
+    def _open(self, fd, table):
+        self._file = os.fdopen(fd, "w", encoding="utf-8", newline="", buffering=self.BUFFER_BYTES)
+        self.write_row(table.columns)
+
+    def write_row(self, row):
+        self._file.write(",".join(escape_csv_field("" if value is None else str(value)) for value in row) + "\n")
+
+    def _finish(self):
+        self._file.close()
+
+
+#Columnar copy of every table, one Parquet file each.  Rows are gathered into
+#record batches of BATCH_ROWS and written as they fill up.  Every column is a
+#string column: the sheets mix numbers and blanks in the same column.
+class ParquetSink(FileSink):
+    extension = ".parquet"
+    BATCH_ROWS = 10000
+
+    def __init__(self, directory=".", suffix=""):
+        load_pyarrow()
+        super().__init__(directory, suffix)
+
+    def _open(self, fd, table):
+        os.close(fd)
+        names = []
+        for column in table.columns:
+            #Parquet wants unique column names; the choice tables repeat
+            #"Next Best Alternative".
+            name, n = str(column), 2
+            while name in names:
+                name, n = f"{column} {n}", n + 1
+            names.append(name)
+        self._schema = pa.schema([(name, pa.string()) for name in names])
+        self._writer = pq.ParquetWriter(self._tmppath, self._schema)
+        self._batch = [[] for _ in names]
+
+    def write_row(self, row):
+        for i, column in enumerate(self._batch):
+            value = row[i] if i < len(row) else None
+            column.append(None if value is None else str(value))
+        if len(self._batch[0]) >= self.BATCH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._batch[0]:
+            self._writer.write_batch(pa.record_batch(self._batch, schema=self._schema))
+            self._batch = [[] for _ in self._batch]
+
+    def _finish(self):
+        try:
+            self._flush()
+        finally:
+            self._writer.close()
+
+
+#The spreadsheet gets every tab in one publish_sheets() call, so this sink is
+#the one place rows are held until the end of the run.
+class SheetsSink(OutputSink):
+    def __init__(self, spreadsheet_id, only_changed=False):
+        self.spreadsheet_id = spreadsheet_id
+        self.only_changed = only_changed
+        self.tabs = {}
+        self.written = []
+        self._rows = None
+
+    def open_table(self, table: OutputTable):
+        self._rows = [list(table.columns)] if table.columns_in_sheet else []
+        self.tabs[table.name] = self._rows
+
+    def write_row(self, row):
+        self._rows.append(row)
+
+    def close(self):
+        if self.tabs:
+            self.written = publish_sheets(get_sheets_service(), self.spreadsheet_id, self.tabs,
+                                          only_changed=self.only_changed)
@@ -1,25 +1,48 @@
 from models.player import Player
 
 players: list[Player] = []
+#players looked up by (name, spec) -> index, and name -> indices of every spec
+#seen for that character.  add_player() and sort_players() keep these in step
+#with the players list.
+playerIndex: dict[tuple, int] = {}
+playerSpecs: dict[str, list[int]] = {}
 
 def add_player(charname, spec):
-    pindex = -1
-    multispec = False
-    for i in range(len(players)):
-        if charname == players[i].name:
-            if spec == players[i].spec:
-                pindex = i
-                break
-            else:
-                players[i].multispec = True
-                multispec = True
-
-    if pindex == -1:
-        players.append(Player(charname, spec, multispec))
-        pindex = len(players) - 1  # Ensure pindex is set for new player
+    pindex = playerIndex.get((charname, spec))
+    if pindex is not None:
+        return pindex
 
+    #A new spec for a character we already have: every one of their specs
+    #needs the spec shown next to the name from now on.
+    otherspecs = playerSpecs.setdefault(charname, [])
+    for i in otherspecs:
+        players[i].multispec = True
+    players.append(Player(charname, spec, len(otherspecs) > 0))
+    pindex = len(players) - 1
+    playerIndex[(charname, spec)] = pindex
+    otherspecs.append(pindex)
     return pindex
 
+def reset_players():
+    players.clear()
+    playerIndex.clear()
+    playerSpecs.clear()
+
+def reindex_players():
+    playerIndex.clear()
+    playerSpecs.clear()
+    for i, p in enumerate(players):
+        playerIndex[(p.name, p.spec)] = i
+        playerSpecs.setdefault(p.name, []).append(i)
+
+def sort_players():
+    #Sort players alphabetically, and by role.  Tanks first, then DPS, then
+    #healers.
+    #Sort alphabetically first so that the role sorting actually works.
+    players.sort(key=lambda p: p.name)
+    players.sort(key=rolekey)
+    reindex_players()
+
 def rolekey(p):
     if p.spec == "Protection" or \
        p.spec == "Blood" or \
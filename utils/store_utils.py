@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import threading
+from models.item_key import item_key
+from models.report import ReportResult
+from utils.cache_utils import CACHE_DIR
+
+#Small lookups that never change once we know them (wowhead item names and
+#slots, the spec an armory-imported report was simmed as, ...) are kept in one
+#SQLite file so every run after the first can skip the network for them.
+METADATA_DB = os.path.join(CACHE_DIR, "metadata.sqlite")
+#Parsed reports, so a report is only ever parsed once.
+REPORTS_DB = os.path.join(CACHE_DIR, "reports.sqlite")
+
+#Stay well under SQLite's bound parameter limit.
+_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wowhead_items (
+    item_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    inventory_slot TEXT
+);
+CREATE TABLE IF NOT EXISTS character_specs (
+    region TEXT NOT NULL,
+    realm TEXT NOT NULL,
+    charname TEXT NOT NULL,
+    report_hash TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    PRIMARY KEY (region, realm, charname, report_hash)
+);
+"""
+
+#report_sims.value has no declared type on purpose: SQLite then keeps ints as
+#ints and floats as floats, and the sheets show values exactly as parsed.
+#Items are stored as their ItemKey's item_id and name (the item level is the
+#end of the name).
+_REPORTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    charname TEXT NOT NULL,
+    spec TEXT,
+    resolve_bosses INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS report_entries (
+    report_key TEXT NOT NULL REFERENCES reports (report_key) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    item_id INTEGER,
+    itemname TEXT NOT NULL,
+    slot TEXT,
+    source TEXT,
+    boss TEXT,
+    PRIMARY KEY (report_key, seq)
+);
+CREATE TABLE IF NOT EXISTS report_sims (
+    report_key TEXT NOT NULL REFERENCES reports (report_key) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    item_id INTEGER,
+    itemname TEXT NOT NULL,
+    value NOT NULL,
+    PRIMARY KEY (report_key, seq)
+);
+"""
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), _CHUNK):
+        yield values[i:i + _CHUNK]
+
+#version is kept in the file's user_version.  A file from an older layout
+#has the tables in tables dropped and made again: only stores of things that
+#can be fetched again list any.
+class SQLiteStore:
+    schema = ""
+    version = 1
+    tables = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        #Opened on first use so importing this module has no side effects.
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != self.version:
+                with self._conn:
+                    for table in self.tables:
+                        self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._conn.execute(f"PRAGMA user_version = {int(self.version)}")
+            self._conn.executescript(self.schema)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class MetadataStore(SQLiteStore):
+    schema = _SCHEMA
+
+    def __init__(self, path=METADATA_DB):
+        super().__init__(path)
+
+    def get_items(self, item_ids):
+        """Return {item_id: (name, inventory_slot)} for the ids we already know."""
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for chunk in _chunks(item_ids):
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT item_id, name, inventory_slot FROM wowhead_items WHERE item_id IN ({marks})",
+                    chunk)
+                for item_id, name, slot in rows:
+                    found[item_id] = (name, slot)
+        return found
+
+    def put_items(self, items):
+        """Store {item_id: (name, inventory_slot)} in one transaction."""
+        if not items:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO wowhead_items (item_id, name, inventory_slot) VALUES (?, ?, ?)",
+                    [(item_id, name, slot) for item_id, (name, slot) in items.items()])
+
+    def get_spec(self, region, realm, charname, report_hash):
+        """Return the spec remembered for this character's report, or None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT spec FROM character_specs WHERE region = ? AND realm = ? AND charname = ? AND report_hash = ?",
+                (region, realm, charname, report_hash)).fetchone()
+        return row[0] if row else None
+
+    def put_spec(self, region, realm, charname, report_hash, spec):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO character_specs (region, realm, charname, report_hash, spec) VALUES (?, ?, ?, ?, ?)",
+                    (region, realm, charname, report_hash, spec))
+
+
+#Every report's parsed rows (player, items with their slot, source and boss,
+#and sims), written once per report key: a raidbots report hash or "qe:" plus
+#a QE report ID.  Reports never change once they're made, so a run only has to
+#fetch and parse the ones that aren't in here yet.
+class ReportStore(SQLiteStore):
+    schema = _REPORTS_SCHEMA
+    #2: items stored by ItemKey.  3: no ilvl column or query indexes.
+    version = 3
+    tables = ("report_sims", "report_entries", "reports")
+
+    def __init__(self, path=REPORTS_DB):
+        super().__init__(path)
+
+    def get_reports(self, keys_by_url):
+        """
+        Return {report key: ReportResult} for the keys we have, given
+        {url: report key}.  Each result gets the first url that asked for it.
+        """
+        urls = {}
+        for url, key in keys_by_url.items():
+            if key is not None:
+                urls.setdefault(key, url)
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for chunk in _chunks(urls):
+                marks = ",".join("?" * len(chunk))
+                for key, charname, spec, resolve_bosses in conn.execute(
+                        f"SELECT report_key, charname, spec, resolve_bosses FROM reports WHERE report_key IN ({marks})",
+                        chunk):
+                    result = ReportResult(urls[key])
+                    result.charname = charname
+                    result.spec = spec
+                    result.resolve_bosses = bool(resolve_bosses)
+                    found[key] = result
+                for key, item_id, itemname, slot, source, boss in conn.execute(
+                        f"SELECT report_key, item_id, itemname, slot, source, boss FROM report_entries "
+                        f"WHERE report_key IN ({marks}) ORDER BY report_key, seq", chunk):
+                    found[key].add_entry(item_key(item_id, itemname), slot, source, boss)
+                for key, item_id, itemname, value in conn.execute(
+                        f"SELECT report_key, item_id, itemname, value FROM report_sims "
+                        f"WHERE report_key IN ({marks}) ORDER BY report_key, seq", chunk):
+                    found[key].sims[item_key(item_id, itemname)] = value
+        return found
+
+    def put_reports(self, results):
+        """Store {report key: ReportResult} in one transaction, replacing what was there."""
+        if not results:
+            return
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM reports WHERE report_key = ?", [(key,) for key in results])
+                conn.executemany(
+                    "INSERT INTO reports (report_key, url, charname, spec, resolve_bosses) VALUES (?, ?, ?, ?, ?)",
+                    [(key, r.url, r.charname, r.spec, int(r.resolve_bosses)) for key, r in results.items()])
+                conn.executemany(
+                    "INSERT INTO report_entries (report_key, seq, item_id, itemname, slot, source, boss) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(key, seq, item.item_id, item.name, slot, source, boss)
+                     for key, r in results.items() for seq, (item, slot, source, boss) in enumerate(r.entries)])
+                conn.executemany(
+                    "INSERT INTO report_sims (report_key, seq, item_id, itemname, value) VALUES (?, ?, ?, ?, ?)",
+                    [(key, seq, item.item_id, item.name, value) for key, r in results.items()
+                     for seq, (item, value) in enumerate(r.sims.items())])
+
+
+metadata_store = MetadataStore()
+report_store = ReportStore()
@@ -0,0 +1,79 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+#A thread pool whose threads never keep the process alive.  Fetches run on
+#these: once a run has given up on a fetch (the deadline went, say), it
+#mustn't have to wait for it anyway at exit, and ThreadPoolExecutor joins
+#its threads at exit even after shutdown(wait=False).  These threads are
+#daemons, so whatever they're still doing when the main thread is done is
+#dropped.
+#
+#Same submit/map/shutdown as ThreadPoolExecutor, and submit() returns a
+#concurrent.futures.Future, so wait() and as_completed() work on them.
+class DaemonThreadPool:
+    def __init__(self, max_workers, name="worker"):
+        self.max_workers = max(1, max_workers)
+        self._name = name
+        self._tasks = queue.SimpleQueue()
+        self._threads = []
+        #Released by a thread each time it finishes a task, so a submit can
+        #tell whether there's a thread free before starting another.
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit to a pool that has been shut down")
+            self._tasks.put((future, fn, args, kwargs))
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name=f"{self._name}_{len(self._threads)}",
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (future.result() for future in futures)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, fn, args, kwargs = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            self._idle.release()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        task = self._tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    task[0].cancel()
+            for _ in self._threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+        return False
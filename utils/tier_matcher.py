@@ -0,0 +1,15 @@
+import re
+
+#Answers "is this a tier piece?" for an item name, from the set names in
+#data/tier_keywords.json.
+#
+#Tier detection runs on every item of every report, so it's one search with a
+#precompiled alternation of the set names (case-sensitive, like the names in
+#the table).  Which piece it is comes from the profileset's slot; see
+#tier_item_key().
+class TierMatcher:
+    def __init__(self, tiernames):
+        self._tier = re.compile("|".join(re.escape(name) for name in tiernames)) if tiernames else None
+
+    def is_tier(self, itemname):
+        return self._tier is not None and self._tier.search(itemname) is not None
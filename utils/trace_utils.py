@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from collections import Counter
+
+#Where a run spends its time.  Spans cover every fetch, parse and compute
+#stage; counters count things like cache hits and lookups that failed.
+#--trace writes the spans in Chrome's trace-event format (open it in
+#chrome://tracing or ui.perfetto.dev), and summary() totals both up at the end
+#of a run.
+class Span:
+    def __init__(self, tracer, name, category, args):
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        #Anything worth knowing about this span; add to it while it's open.
+        self.args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        #GeneratorExit and friends just mean the block was cut short.
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.args["error"] = exc_type.__name__
+        self._tracer._record(self, self._start, time.perf_counter_ns())
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._events = []
+        self._threads = {}
+        self.counters = Counter()
+        #One example of what was counted, for counters that keep one.
+        self.examples = {}
+
+    def span(self, name, category, **args):
+        """Time a block: with tracer.span("data.csv", "fetch", host=...) as span: ..."""
+        return Span(self, name, category, args)
+
+    def count(self, name, n=1, example=None):
+        with self._lock:
+            self.counters[name] += n
+            if example is not None:
+                self.examples.setdefault(name, example)
+
+    def _record(self, span, start, end):
+        thread = threading.current_thread()
+        with self._lock:
+            tid = self._threads.setdefault(thread.ident, (len(self._threads) + 1, thread.name))[0]
+            self._events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": 1,
+                "tid": tid,
+                "args": span.args,
+            })
+
+    def reset(self):
+        with self._lock:
+            self._origin = time.perf_counter_ns()
+            self._events.clear()
+            self._threads.clear()
+            self.counters.clear()
+            self.examples.clear()
+
+    def chrome_trace(self):
+        with self._lock:
+            events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                      for tid, name in self._threads.values()]
+            events.extend(self._events)
+            end = (time.perf_counter_ns() - self._origin) / 1000
+            events.extend({"name": name, "ph": "C", "ts": end, "pid": 1, "tid": 0, "args": {"count": count}}
+                          for name, count in self.counters.items())
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+
+    def summary(self):
+        """Spans totalled by category and name, then every counter, as printable lines."""
+        with self._lock:
+            totals = {}
+            for event in self._events:
+                total = totals.setdefault((event["cat"], event["name"]), [0, 0.0, 0.0])
+                total[0] += 1
+                total[1] += event["dur"]
+                total[2] = max(total[2], event["dur"])
+            counters = list(self.counters.items())
+        lines = []
+        if totals:
+            lines.append(f"{'category':<10} {'span':<28} {'count':>6} {'total ms':>10} {'max ms':>9}")
+            for (category, name), (count, total, longest) in sorted(totals.items(), key=lambda t: -t[1][1]):
+                lines.append(f"{category:<10} {name[:28]:<28} {count:>6} {total / 1000:>10.1f} {longest / 1000:>9.1f}")
+        for name, count in counters:
+            lines.append(f"{name}: {count}")
+        return lines
+
+
+tracer = Tracer()